@@ -3,13 +3,29 @@ This is a Mapped schema class
 
 It is used to map json and pydantic models to each other
 """
+
+import contextvars
+import hashlib
+import inspect
+import itertools
+import json
+import linecache
+import operator
+import pickle
+import threading
+import time
+import warnings
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from typing import Union
 
 # Installed Packages
-from glom import glom
+from glom import SKIP, STOP, Coalesce, GlomError, Path, Spec, glom
+from glom.core import TType
 from pydantic import BaseModel as BM
-from pydantic import validator
+from pydantic import Extra, ValidationError, root_validator
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON
+
 
 class DefaultBaseModel(BM):
     class Config:
@@ -19,12 +35,54 @@ class DefaultBaseModel(BM):
         orm_mode = True
         nones_to_default = True
 
-    @validator("*", pre=True, always=True)
-    def _convert_nones_to_default(cls, val, field):
-        nones_to_default = getattr(cls.Config, "nones_to_default", True)
-        if nones_to_default and field.default and val is None:
-            return field.default
-        return val
+    # {field name: (input keys, default)} of the fields whose Nones are
+    # replaced by their default, built once per class by __init_subclass__
+    __nones_to_default__ = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        table = {}
+        if getattr(cls.Config, "nones_to_default", True):
+            for name, field in cls.__fields__.items():
+                if field.default:
+                    keys = (name,) if field.alias == name else (field.alias, name)
+                    table[name] = (keys, field.default)
+        cls.__nones_to_default__ = table
+        # like the per field validator it replaces, Nones are replaced after
+        # the subclasses' own pre root validators
+        validators = cls.__pre_root_validators__
+        last = [v for v in validators if v.__name__ == "_convert_nones_to_default"]
+        others = [v for v in validators if v.__name__ != "_convert_nones_to_default"]
+        cls.__pre_root_validators__ = others + last
+
+    @root_validator(pre=True, allow_reuse=True)
+    def _convert_nones_to_default(cls, values):
+        converted = None
+        for keys, default in cls.__nones_to_default__.values():
+            for key in keys:
+                # defaults are truthy, so only a given None matches
+                if values.get(key, default) is None:
+                    if converted is None:
+                        converted = dict(values)
+                    converted[key] = default
+        return values if converted is None else converted
+
+    def __setattr__(self, name, value):
+        # validated assignments check the original value, not the one returned
+        # by pre root validators, so Nones are replaced here
+        if value is None and name in self.__nones_to_default__:
+            if self.__config__.validate_assignment:
+                value = self.__nones_to_default__[name][1]
+        super().__setattr__(name, value)
+
+
+def _has_pre_root_validators(model) -> bool:
+    """True when a model has pre root validators besides the nones_to_default
+    one, they receive every input key and may fill fields from other keys
+    """
+    validators = getattr(model, "__pre_root_validators__", ())
+    return any(v.__name__ != "_convert_nones_to_default" for v in validators)
+
 
 class IgnoreGlom(str):
     """
@@ -39,178 +97,3077 @@ class IgnoreGlom(str):
         return f"IgnoreGlom({super().__repr__()})"
 
 
-class _MappingMixinBase(ABC):
-    @property
-    @abstractmethod
-    def output_model(self) -> DefaultBaseModel:
-        return DefaultBaseModel
+MISSING = object()
+
+
+class Aggregate(ABC):
+    """Base of the aggregation specs, which reduce the items found at a path
+
+    value is a glom spec run on each item (a path, a callable or another
+    aggregate), items where it finds nothing or None are left out. They can
+    be used as map values or inside glom specs like any callable, compiled
+    maps loop over the items once without building intermediate lists
+    """
+
+    def __init__(self, path, value=None):
+        self.path = path
+        self.value = value
+        self.key = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.path!r}, {self.value!r})"
+
+    def __call__(self, target):
+        items = target if self.path is None else glom(target, self.path, default=None)
+
+        def value(item):
+            return glom(item, self.value, default=None)
+
+        def key(item):
+            return glom(item, self.key, default=None)
+
+        return self.reduce(
+            items or (),
+            value if self.value is not None else None,
+            key if self.key is not None else None,
+        )
 
-    @property
     @abstractmethod
-    def map(self):
-        return self.default_map()
+    def reduce(self, items, value, key):
+        """Reduces items, value and key return an item's value and key or
+        None/MISSING when it has none. A None value means the item itself
+        """
 
-    def process_map(self, map_dict: dict, input_dict: dict):
-        return {k: self.process_map_value(v, input_dict) for k, v in map_dict.items()}
 
-    def process_map_value(self, value, input_dict: dict):
-        if isinstance(value, IgnoreGlom):
-            # This needs to be at the top
-            return str(value)
-        if isinstance(value, str):
-            return glom(input_dict, value, default=value)
+class Sum(Aggregate):
+    """Sum("discounts", "discounted_amount") adds up the discounted amounts"""
 
-        if isinstance(value, tuple):
-            keys, search = value
-            if isinstance(keys, list):
-                combined = []
-                for val in keys:
-                    result = glom(input_dict, (val, search), default=None)
-                    if isinstance(result, list):
-                        combined += result
-                    if isinstance(result, str):
-                        combined.append(result)
-                return combined
-            if isinstance(keys, str):
-                return glom(input_dict, value, default=None)
-        if isinstance(value, dict):
-            return self.process_map(value, input_dict)
-        if isinstance(value, list):
-            return [self.process_map_value(v, input_dict) for v in value]
+    def reduce(self, items, value, key):
+        total = 0
+        for item in items:
+            val = item if value is None else value(item)
+            if val is not None and val is not MISSING:
+                total += val
+        return total
 
-        if callable(value):
-            return value(input_dict)
-        else:
-            return value
 
+class Count(Aggregate):
+    """Count("line_items.physical_items") counts the items, with a value only
+    the items that have one
+    """
 
-class MappedModel(DefaultBaseModel, _MappingMixinBase, ABC):
+    def reduce(self, items, value, key):
+        if value is None:
+            return sum(1 for _ in items)
+        count = 0
+        for item in items:
+            val = value(item)
+            if val is not None and val is not MISSING:
+                count += 1
+        return count
+
+
+class Min(Aggregate):
+    """Min("discounts", "discounted_amount") is the smallest value or None"""
+
+    def reduce(self, items, value, key):
+        least = None
+        for item in items:
+            val = item if value is None else value(item)
+            if val is not None and val is not MISSING:
+                if least is None or val < least:
+                    least = val
+        return least
+
+
+class Max(Aggregate):
+    """Max("discounts", "discounted_amount") is the largest value or None"""
+
+    def reduce(self, items, value, key):
+        most = None
+        for item in items:
+            val = item if value is None else value(item)
+            if val is not None and val is not MISSING:
+                if most is None or val > most:
+                    most = val
+        return most
+
+
+class GroupBy(Aggregate):
+    """GroupBy("line_items.physical_items", "product_id") groups the items
+    into {product_id: [items]}, or into lists of their value when given
+
+    Items without the key are grouped under None
     """
-    A Pydantic Mapped model class
 
-    ...
+    def __init__(self, path, key, value=None):
+        super().__init__(path, value)
+        self.key = key
 
-    Class Attributes
-    ----------
-    mapped : Model
-        converts a python dict to the corresponding mapped model
-    output_model : DefaultBaseModel
-        return a DefaultBaseModel
-    map : int
-        returns a map of dict keys
+    def __repr__(self):
+        return f"GroupBy({self.path!r}, {self.key!r}, {self.value!r})"
 
-    Methods
-    -------
-    default_map(exclude: Union[set, dict]):
-        returns mapped dict keys with optionalexclude keys param
+    def reduce(self, items, value, key):
+        groups = {}
+        for item in items:
+            val = item if value is None else value(item)
+            if val is None or val is MISSING:
+                continue
+            group = key(item)
+            if group is MISSING:
+                group = None
+            if group in groups:
+                groups[group].append(val)
+            else:
+                groups[group] = [val]
+        return groups
+
+
+def _merge_items(value):
+    """Returns the items a Merge source contributes, a single value is one item"""
+    if value is None or value is MISSING:
+        return ()
+    if type(value) is list or type(value) is tuple:
+        return value
+    return (value,)
+
+
+class Merge:
+    """Merges the items found at several paths into one list
+
+        Merge(
+            ["line_items.physical_items", "line_items.digital_items"],
+            {"price": "list_price"},
+            key="id",
+        )
+
+    The sources are chained lazily and search (a glom spec) runs on each
+    item, so no intermediate list is built per path. Unlike the (keys,
+    search) tuple, a source that isn't a list is one item instead of being
+    dropped, and items search finds nothing for are left out.
+
+    key (a glom spec run on each item before search) de-duplicates items:
+    keep="first" keeps the first item of each key and skips searching the
+    others, keep="last" keeps the first position with the last item's value.
+    Items without a key are always kept
     """
 
-    @property
-    def mapped(self):
-        input_dict = self.dict()
-        processed_map = self.process_map(self.map, input_dict)
-        return self.output_model(**processed_map)
+    def __init__(self, keys: list, search=None, key=None, keep: str = "first"):
+        if keep not in ("first", "last"):
+            raise ValueError(f'keep must be "first" or "last", not {keep!r}')
+        self.keys = keys
+        self.search = search
+        self.key = key
+        self.keep = keep
 
-    def default_map(self, exclude: Union[set, dict] = None):
-        input_dict = self.dict(exclude=exclude)
-        return {k: k for k in input_dict.keys()}
+    def __repr__(self):
+        return (
+            f"Merge({self.keys!r}, {self.search!r}, key={self.key!r}, "
+            f"keep={self.keep!r})"
+        )
 
-    @property
-    def output_model(self) -> DefaultBaseModel:
-        return DefaultBaseModel
+    def __call__(self, target):
+        def search(item):
+            return glom(item, self.search, default=MISSING)
 
-    @property
-    def map(self):
-        return self.default_map()
+        def key(item):
+            return glom(item, self.key, default=None)
 
+        return self.merge(
+            (glom(target, path, default=None) for path in self.keys),
+            search if self.search is not None else None,
+            key if self.key is not None else None,
+        )
 
-class MapDictToModel(_MappingMixinBase, ABC):
-    """Leverages Glom to map python dictionaries to a mapped pydantic model
+    def merge(self, sources, search, key) -> list:
+        """Merges the values found at each path, search and key return an
+        item's result and key or MISSING when it has none
+        """
+        items = itertools.chain.from_iterable(map(_merge_items, sources))
+        merged = []
+        positions = {}
+        for item in items:
+            if key is not None:
+                item_key = key(item)
+                if item_key is MISSING:
+                    item_key = None
+                if item_key is not None and item_key in positions:
+                    if self.keep == "first":
+                        continue
+            else:
+                item_key = None
+            value = item if search is None else search(item)
+            if value is MISSING or value is SKIP:
+                continue
+            if value is STOP:
+                break
+            if item_key is None:
+                merged.append(value)
+            elif item_key in positions:
+                merged[positions[item_key]] = value
+            else:
+                positions[item_key] = len(merged)
+                merged.append(value)
+        return merged
 
-    glom works by by doing nested dictionary searches
-    so instead of data['a']['b']['c']
-    we use glom(data, 'a.b.c')
 
-    This class uses glom to map key value pairs to a Pydantic model Field
-    map: dict = {
-        "Pydantic Model Field": "glom.recursive.lookup"
-        }
+class TTLCache:
+    """Least recently used cache whose entries also expire after ttl seconds
 
-    We leverage tuples to collapse values to a list and to merge nested structs
+    Thread safe, counts its hits, misses and evictions, see stats()
+    """
 
-    # nested dictionary structures
-    key: ("lookup.value", [{"nested_key", "nested_key_lookup"}])
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
 
-    # merged keys
-    key: (["lookup.value"], "loo")
+    def __len__(self):
+        return len(self._entries)
 
-    Example dictionary Input:
+    def __getstate__(self):
+        # worker processes get an empty cache with the same settings
+        return {"maxsize": self.maxsize, "ttl": self.ttl}
 
-        input_dict = {
-                "items": {
-                    "price": 7,
-                    "price2": 7,
-                    "nested": [
-                        {"list_val": 1, "amount": 3.05},
-                        {"list_val": 2, "amount": 4},
-                    ],
-                    "identical": "value to be combined",
-                },
-                "items2": {"identical": "second value to be combined"},
-            }
-    Example Pydantic Model:
+    def __setstate__(self, state):
+        self.__init__(**state)
 
-        class APydanticModel(BM):
-            my_pydantic_field: int
-            my_nested_fields: list
-            my_collapsible_field: list
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return default
 
-    Example MapDictToModel class:
+    def set(self, key, value):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
 
-         class MyClass(MapDictToModel):
-            output_model = APydanticModel
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
 
-            map: dict = {
-                "my_pydantic_field": "items.price",
-                "my_nested_fields": (
-                    "items.nested",
-                    [
-                        {
-                            "my_list_val": "list_val",
-                            "my_amount": "amount",
-                        }
-                    ],
-                ),
-                "my_collapsible_field": (["items", "items2"], "identical"),
-            }
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+        }
+
+
+class Lookup:
+    """Looks up a value by the key found at key_path, with batched loading
+
+    loader(keys) takes a list of keys and returns {key: value}, keys it
+    leaves out are None. Mapper batches (apply, map_many, iter_mapped...)
+    collect the keys of every record first and call the loader once per
+    batch, so 200 line items make one call instead of 200. Outside of a
+    batch, like in process_map, each key is loaded on its own.
+
+    cache, a TTLCache, keeps loaded values between batches
+
+    Like coroutine functions, lookups are filled in after the map is
+    evaluated, so their values can't be passed to further glom spec steps
 
     Usage:
-        my_pydantic_model = MyClass(input_dict).mapped
-        my_pydantic_model.my_pydantic_field
-            result -> 7
-        my_pydantic_model.my_nested_fields
-            result -> [{'my_list_val': 1, 'my_amount': 3.05}, {'my_list_val': 2, 'my_amount': 4}]
-        my_pydantic_model.my_collapsible_field
-            result -> ['value to be combined', 'second value to be combined']
+        "product": Lookup("product_id", load_products, cache=TTLCache(ttl=60))
     """
 
-    input_dict: dict = None
+    def __init__(self, key_path, loader, cache: TTLCache = None):
+        self.key_path = key_path
+        self.loader = loader
+        self.cache = cache
 
-    def __init__(self, input_dict: dict, *args, **kwargs):
-        """
-        Initializes input dictionary and super inits _MappingMixinBase
-        """
-        self.input_dict = input_dict
-        super().__init__(*args, **kwargs)
+    def __repr__(self):
+        return f"Lookup({self.key_path!r}, {self.loader!r})"
 
-    @property
-    def mapped(self):
-        processed_map = self.process_map(self.map, self.input_dict)
-        return self.output_model(**processed_map)
+    def __call__(self, target):
+        return self.resolve(glom(target, self.key_path, default=None))
+
+    def resolve(self, key):
+        """Returns the value for key, or a placeholder when a batch is collecting"""
+        if key is None:
+            return None
+        batch = _LOOKUP_BATCH.get()
+        if batch is None:
+            return self.load([key])[key]
+        batch.setdefault(self, {})[key] = None
+        return _Pending(self, key)
+
+    def load(self, keys: list) -> dict:
+        """Returns {key: value} for keys, calling the loader for the ones not cached"""
+        found = {}
+        missing = []
+        for key in keys:
+            value = MISSING if self.cache is None else self.cache.get(key, MISSING)
+            if value is MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            loaded = self.loader(missing)
+            for key in missing:
+                found[key] = loaded.get(key)
+                if self.cache is not None:
+                    self.cache.set(key, found[key])
+        return found
+
+
+class _Pending:
+    """Placeholder for a Lookup value, filled in when its batch is loaded"""
+
+    __slots__ = ("lookup", "key")
+
+    def __init__(self, lookup: Lookup, key):
+        self.lookup = lookup
+        self.key = key
+
+
+_LOOKUP_BATCH = contextvars.ContextVar("lookup_batch", default=None)
+
+
+class _ConstNode:
+    """Compiled map value that returns a constant"""
+
+    __slots__ = ("value",)
+    needs_dict = False
+    paths = None
+    saved_steps = 0
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self, input_dict: dict):
+        return self.value
+
+
+class _GlomNode:
+    """Compiled map value that runs a glom spec against the input"""
+
+    __slots__ = ("spec", "default")
+    needs_dict = True
+    paths = None
+    saved_steps = 0
+
+    def __init__(self, spec, default=None):
+        self.spec = spec
+        self.default = default
+
+    def __call__(self, input_dict: dict):
+        return glom(input_dict, self.spec, default=self.default)
+
+
+_PLAIN_TYPES = frozenset((str, int, float, bool, type(None)))
+
+
+def _field_to_dict(model, value):
+    """Converts a value read from a model field the same way model.dict() does"""
+    if type(value) in _PLAIN_TYPES:
+        return value
+    return model._get_value(
+        value,
+        to_dict=True,
+        by_alias=False,
+        include=None,
+        exclude=None,
+        exclude_unset=False,
+        exclude_defaults=False,
+        exclude_none=False,
+    )
+
+
+def _path_steps(keys: tuple) -> tuple:
+    """Returns (key, list index, rest of the path as a glom Path) for each key
+
+    glom reads list items with int(key), so the index is parsed up front
+    """
+    steps = []
+    for i, key in enumerate(keys):
+        try:
+            index = int(key)
+        except ValueError:
+            index = None
+        steps.append((key, index, Path(*keys[i:])))
+    return tuple(steps)
+
+
+class _Stuck:
+    """Value a shared prefix could not step into with dict or list lookups
+
+    Each path below it finishes with glom from here, like _PathNode would
+    """
+
+    __slots__ = ("target", "depth")
+
+    def __init__(self, target, depth: int):
+        self.target = target
+        self.depth = depth
+
+
+def _step(cur, key, index, depth: int):
+    """One _PrefixTrie step from a value that isn't a dict"""
+    if cur is MISSING or type(cur) is _Stuck:
+        return cur
+    if type(cur) is list:
+        if index is None or not -len(cur) <= index < len(cur):
+            return MISSING
+        return cur[index]
+    return _Stuck(cur, depth)
+
+
+def _unstick(stuck: _Stuck, keys: tuple):
+    """Finishes the path keys with glom from where a _PrefixTrie got stuck"""
+    return glom(stuck.target, Path(*keys[stuck.depth :]), default=MISSING)
+
+
+class _PrefixTrie:
+    """Resolves several paths against one target, walking each shared prefix once
+
+    The trie is flattened into a list of (source, key, index, destination,
+    depth) steps over a list of intermediate values, so ["items.0.a",
+    "items.0.b"] looks up "items" and "0" once and only the last keys twice.
+    Calling it returns the value of each path in order, MISSING on a miss
+    """
+
+    __slots__ = ("program", "size", "leaves", "saved_steps")
+
+    def __init__(self, paths: list):
+        registers = {(): 0}
+        program = []
+        for keys in paths:
+            for depth, (key, index, _) in enumerate(_path_steps(keys)):
+                prefix = keys[: depth + 1]
+                if prefix not in registers:
+                    registers[prefix] = len(registers)
+                    program.append(
+                        (registers[keys[:depth]], key, index, registers[prefix], depth)
+                    )
+        self.program = tuple(program)
+        self.size = len(registers)
+        self.leaves = tuple((registers[keys], keys) for keys in paths)
+        self.saved_steps = sum(len(keys) for keys in paths) - len(program)
+
+    def __call__(self, target) -> list:
+        values = [target] * self.size
+        for src, key, index, dst, depth in self.program:
+            cur = values[src]
+            if type(cur) is dict:
+                values[dst] = cur.get(key, MISSING)
+            else:
+                values[dst] = _step(cur, key, index, depth)
+        found = []
+        for register, keys in self.leaves:
+            value = values[register]
+            if type(value) is _Stuck:
+                value = _unstick(value, keys)
+            found.append(value)
+        return found
+
+
+def _hoist(items: tuple):
+    """Builds a _PrefixTrie over the paths of the hoistable nodes in items
+
+    Returns (trie, plan) where plan holds (key, node, start, end) and
+    found[start:end] are the values of node.paths, or (None, None) when
+    no prefix is shared and walking each path on its own is cheaper
+    """
+    paths = []
+    plan = []
+    for key, node in items:
+        node_paths = getattr(node, "paths", None)
+        if node_paths:
+            plan.append((key, node, len(paths), len(paths) + len(node_paths)))
+            paths.extend(node_paths)
+        else:
+            plan.append((key, node, None, None))
+    trie = _PrefixTrie(paths)
+    if trie.saved_steps <= 0:
+        return None, None
+    return trie, tuple(plan)
+
+
+class _PathNode:
+    """Compiled dotted path string, resolved with plain dict and list lookups
+
+    A missing key or index returns the default without raising, so sparse
+    payloads don't pay for glom's PathAccessError. Values that are neither
+    dicts nor lists fall back to glom for the rest of the path, so objects
+    behave exactly like glom.
+
+    When called with a MappedModel instead of a dict, model fields are read
+    from the models' __dict__ and only the value found is converted like
+    self.dict() would, instead of copying the whole model up front
+    """
+
+    __slots__ = ("paths", "steps", "default")
+    needs_dict = False
+    saved_steps = 0
+
+    def __init__(self, keys: tuple, default=None):
+        self.paths = (keys,)
+        self.steps = _path_steps(keys)
+        self.default = default
+
+    def finish(self, found: list, input_dict: dict):
+        """Returns the result for the value a _PrefixTrie found for the path"""
+        if found[0] is MISSING:
+            return self.default
+        return found[0]
+
+    def __call__(self, input_dict: dict):
+        cur = input_dict
+        model = None
+        for key, index, rest in self.steps:
+            if type(cur) is dict:
+                cur = cur.get(key, MISSING)
+            elif type(cur) is list:
+                if index is None or not -len(cur) <= index < len(cur):
+                    return self.default
+                cur = cur[index]
+                continue
+            elif (
+                (model is not None or cur is input_dict)
+                and isinstance(cur, BM)
+                and not getattr(cur, "__exclude_fields__", None)
+            ):
+                model = type(cur)
+                cur = cur.__dict__.get(key, MISSING)
+            else:
+                if model is not None:
+                    cur = _field_to_dict(model, cur)
+                return glom(cur, rest, default=self.default)
+            if cur is MISSING:
+                return self.default
+        if model is not None:
+            return _field_to_dict(model, cur)
+        return cur
+
+
+class _SearchNode:
+    """Compiled ("dotted.path", search) tuple
+
+    The path is resolved with _PathNode and the search with compiled glom spec
+    nodes, following glom's tuple rules for SKIP and STOP
+    """
+
+    __slots__ = ("paths", "path", "search", "saved_steps")
+    needs_dict = False
+
+    def __init__(self, keys: tuple, search, compiled=None):
+        self.paths = (keys,)
+        self.path = _PathNode(keys, default=MISSING)
+        self.search = compiled if compiled is not None else compile_spec(search)
+        self.saved_steps = self.search.saved_steps
+
+    def __call__(self, input_dict: dict):
+        return self.finish((self.path(input_dict),), input_dict)
+
+    def finish(self, found: list, input_dict: dict):
+        """Returns the result for the value a _PrefixTrie found for the path"""
+        found = found[0]
+        if found is MISSING:
+            return None
+        result = self.search(found)
+        if result is MISSING:
+            return None
+        if result is SKIP or result is STOP:
+            return found
+        return result
+
+
+class _RootSpecNode:
+    """Compiled glom spec run against the whole input, with a default on a miss"""
+
+    __slots__ = ("spec", "default", "saved_steps")
+    needs_dict = True
+    paths = None
+
+    def __init__(self, spec, default=None):
+        self.spec = compile_spec(spec)
+        self.default = default
+        self.saved_steps = self.spec.saved_steps
+
+    def __call__(self, input_dict: dict):
+        result = self.spec(input_dict)
+        if result is MISSING:
+            return self.default
+        return result
+
+
+########## glom spec nodes
+# Compiled parts of the glom specs used inside (keys, search) tuples. They
+# return MISSING where glom would raise a GlomError, so a miss costs no
+# exception, and the nearest map value turns MISSING into its default.
+
+
+class _SpecPath:
+    """glom path string"""
+
+    __slots__ = ("paths", "steps")
+    saved_steps = 0
+
+    def __init__(self, keys: tuple):
+        self.paths = (keys,)
+        self.steps = _path_steps(keys)
+
+    def finish(self, found: list, target):
+        return found[0]
+
+    def __call__(self, target):
+        cur = target
+        for key, index, rest in self.steps:
+            if type(cur) is dict:
+                cur = cur.get(key, MISSING)
+                if cur is MISSING:
+                    return MISSING
+            elif type(cur) is list:
+                if index is None or not -len(cur) <= index < len(cur):
+                    return MISSING
+                cur = cur[index]
+            else:
+                return glom(cur, rest, default=MISSING)
+        return cur
+
+
+class _SpecDict:
+    """glom dict spec, the paths of its values share a _PrefixTrie"""
+
+    __slots__ = ("items", "trie", "plan", "saved_steps")
+    paths = None
+
+    def __init__(self, spec: dict):
+        self.items = tuple((k, compile_spec(v)) for k, v in spec.items())
+        self.trie, self.plan = _hoist(self.items)
+        self.saved_steps = sum(node.saved_steps for _, node in self.items)
+        if self.trie is not None:
+            self.saved_steps += self.trie.saved_steps
+
+    def __call__(self, target):
+        if self.trie is not None:
+            return self._hoisted(target)
+        ret = {}
+        for key, node in self.items:
+            val = node(target)
+            if val is MISSING:
+                return MISSING
+            if val is SKIP:
+                continue
+            ret[key] = val
+        return ret
+
+    def _hoisted(self, target):
+        found = self.trie(target)
+        ret = {}
+        for key, node, start, end in self.plan:
+            if start is None:
+                val = node(target)
+            else:
+                val = node.finish(found[start:end], target)
+            if val is MISSING:
+                return MISSING
+            if val is SKIP:
+                continue
+            ret[key] = val
+        return ret
+
+
+class _SpecList:
+    """glom [subspec] spec, which maps the subspec over an iterable target"""
+
+    __slots__ = ("node", "spec", "saved_steps")
+    paths = None
+
+    def __init__(self, spec: list):
+        self.node = compile_spec(spec[0])
+        self.spec = prebuild_spec(spec)
+        self.saved_steps = self.node.saved_steps
+
+    def __call__(self, target):
+        if type(target) is not list and type(target) is not tuple:
+            return glom(target, self.spec, default=MISSING)
+        node = self.node
+        ret = []
+        for item in target:
+            val = node(item)
+            if val is MISSING:
+                return MISSING
+            if val is SKIP:
+                continue
+            if val is STOP:
+                break
+            ret.append(val)
+        return ret
+
+
+class _SpecChain:
+    """glom tuple spec, each subspec runs on the result of the previous one
+
+    A chain starting with a path hoists that path into the enclosing dict
+    """
+
+    __slots__ = ("nodes", "paths", "saved_steps")
+
+    def __init__(self, spec: tuple):
+        self.nodes = tuple(compile_spec(v) for v in spec)
+        self.paths = None
+        if self.nodes and type(self.nodes[0]) is _SpecPath:
+            self.paths = self.nodes[0].paths
+        self.saved_steps = sum(node.saved_steps for node in self.nodes)
+
+    def __call__(self, target, start: int = 0):
+        res = target
+        for node in self.nodes[start:] if start else self.nodes:
+            nxt = node(res)
+            if nxt is MISSING:
+                return MISSING
+            if nxt is SKIP:
+                continue
+            if nxt is STOP:
+                break
+            res = nxt
+        return res
+
+    def finish(self, found: list, target):
+        first = found[0]
+        if first is MISSING:
+            return MISSING
+        if first is STOP:
+            return target
+        if first is SKIP:
+            first = target
+        return self(first, start=1)
+
+
+class _SpecCoalesce:
+    """glom Coalesce, the first subspec that matches and isn't skipped wins
+
+    Only compiled when it catches the default GlomError, so a miss in a
+    subspec is a MISSING result instead of an exception
+    """
+
+    __slots__ = ("nodes", "skip_func", "default", "default_factory", "saved_steps")
+    paths = None
+
+    def __init__(self, spec: Coalesce):
+        kwargs = spec._orig_kwargs
+        self.nodes = tuple(compile_spec(v) for v in spec.subspecs)
+        self.saved_steps = sum(node.saved_steps for node in self.nodes)
+        self.skip_func = spec.skip_func
+        self.default = kwargs.get("default", MISSING)
+        self.default_factory = kwargs.get("default_factory")
+
+    def __call__(self, target):
+        for node in self.nodes:
+            ret = node(target)
+            if ret is not MISSING and not self.skip_func(ret):
+                return ret
+        if self.default is not MISSING:
+            return self.default
+        if self.default_factory is not None:
+            return self.default_factory()
+        return MISSING
+
+
+class _SpecCall:
+    """Callable in a glom spec, called with the current target"""
+
+    __slots__ = ("func",)
+    paths = None
+    saved_steps = 0
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, target):
+        return self.func(target)
+
+
+class _SpecGlom:
+    """Any other glom spec, run by glom itself"""
+
+    __slots__ = ("spec",)
+    paths = None
+    saved_steps = 0
+
+    def __init__(self, spec):
+        self.spec = prebuild_spec(spec)
+
+    def __call__(self, target):
+        return glom(target, self.spec, default=MISSING)
+
+
+class _AggregateNode:
+    """Compiled Aggregate, its path, value and key specs are compiled too"""
+
+    __slots__ = ("aggregate", "path", "value", "key")
+    needs_dict = True
+    paths = None
+    saved_steps = 0
+
+    def __init__(self, aggregate: Aggregate):
+        self.aggregate = aggregate
+        self.path = self.value = self.key = None
+        if aggregate.path is not None:
+            self.path = compile_spec(aggregate.path)
+        if aggregate.value is not None:
+            self.value = compile_spec(aggregate.value)
+        if aggregate.key is not None:
+            self.key = compile_spec(aggregate.key)
+
+    def __call__(self, target):
+        items = target if self.path is None else self.path(target)
+        if items is MISSING or items is None:
+            items = ()
+        return self.aggregate.reduce(items, self.value, self.key)
+
+
+class _LookupNode:
+    """Compiled Lookup, its key path is compiled too"""
+
+    __slots__ = ("lookup", "key")
+    needs_dict = True
+    paths = None
+    saved_steps = 0
+
+    def __init__(self, lookup: Lookup):
+        self.lookup = lookup
+        self.key = compile_spec(lookup.key_path)
+
+    def __call__(self, target):
+        key = self.key(target)
+        return self.lookup.resolve(None if key is MISSING else key)
+
+
+class _MergeSpecNode:
+    """Compiled Merge, its sources, search and key specs are compiled too
+
+    When every source is a plain path, the paths are hoisted into the
+    enclosing map's _PrefixTrie
+    """
+
+    __slots__ = ("merge", "sources", "paths", "search", "key", "saved_steps")
+    needs_dict = True
+
+    def __init__(self, merge: Merge):
+        self.merge = merge
+        self.sources = tuple(compile_spec(path) for path in merge.keys)
+        self.paths = None
+        if all(type(node) is _SpecPath for node in self.sources):
+            self.paths = tuple(node.paths[0] for node in self.sources)
+        self.search = self.key = None
+        if merge.search is not None:
+            self.search = compile_spec(merge.search)
+        if merge.key is not None:
+            self.key = compile_spec(merge.key)
+        self.saved_steps = 0 if self.search is None else self.search.saved_steps
+
+    def __call__(self, target):
+        sources = (node(target) for node in self.sources)
+        return self.merge.merge(sources, self.search, self.key)
+
+    def finish(self, found: list, target):
+        """Returns the result for the values a _PrefixTrie found for self.paths"""
+        return self.merge.merge(found, self.search, self.key)
+
+
+def _compiles_coalesce(spec: Coalesce) -> bool:
+    kwargs = spec._orig_kwargs
+    if kwargs.get("skip_exc", GlomError) is not GlomError:
+        return False
+    # glom evaluates defaults as specs, plain values are returned as they are
+    return type(kwargs.get("default")) in _PLAIN_TYPES
+
+
+def compile_spec(spec):
+    """Compiles a glom spec into nodes that return MISSING instead of raising
+
+    Mirrors the dispatch order of glom's AUTO mode, anything that isn't a
+    plain path, dict, list, tuple, callable or Coalesce is left to glom
+    """
+    if type(spec) is TType:
+        return _SpecGlom(spec)
+    if isinstance(spec, Coalesce) and _compiles_coalesce(spec):
+        return _SpecCoalesce(spec)
+    if callable(getattr(spec, "glomit", None)) and not isinstance(spec, type):
+        return _SpecGlom(spec)
+    if isinstance(spec, str):
+        keys = parse_path(spec)
+        if keys is None:
+            return _SpecGlom(spec)
+        return _SpecPath(keys)
+    if type(spec) is dict and all(type(k) not in (Spec, TType) for k in spec):
+        return _SpecDict(spec)
+    if type(spec) is list and len(spec) == 1:
+        return _SpecList(spec)
+    if type(spec) is tuple:
+        return _SpecChain(spec)
+    if isinstance(spec, Aggregate):
+        return _AggregateNode(spec)
+    if isinstance(spec, Lookup):
+        return _LookupNode(spec)
+    if isinstance(spec, Merge):
+        return _MergeSpecNode(spec)
+    if callable(spec) and not isinstance(spec, (dict, list, tuple)):
+        return _SpecCall(spec)
+    return _SpecGlom(spec)
+
+
+class _MergeNode:
+    """Compiled (keys, search) tuple that combines the results of several keys
+
+    When every key is a plain path, the paths are hoisted into the enclosing
+    map's _PrefixTrie, so "line_items.physical_items" and
+    "line_items.digital_items" look up "line_items" once
+    """
+
+    __slots__ = ("nodes", "needs_dict", "paths", "saved_steps")
+
+    def __init__(self, keys: list, search):
+        compiled = compile_spec(search)
+        self.nodes = tuple(compile_search(key, search, compiled) for key in keys)
+        self.needs_dict = any(node.needs_dict for node in self.nodes)
+        self.paths = None
+        if all(node.paths for node in self.nodes):
+            self.paths = tuple(node.paths[0] for node in self.nodes)
+        self.saved_steps = sum(node.saved_steps for node in self.nodes)
+
+    def __call__(self, input_dict: dict):
+        return self._combine(node(input_dict) for node in self.nodes)
+
+    def finish(self, found: list, input_dict: dict):
+        """Returns the result for the values a _PrefixTrie found for self.paths"""
+        return self._combine(
+            node.finish((value,), input_dict) for node, value in zip(self.nodes, found)
+        )
+
+    @staticmethod
+    def _combine(results) -> list:
+        combined = []
+        for result in results:
+            if isinstance(result, list):
+                combined += result
+            if isinstance(result, str):
+                combined.append(result)
+        return combined
+
+
+class _DictNode:
+    """Compiled nested map
+
+    The paths of its values are resolved together with a _PrefixTrie when
+    they share prefixes. Models are read field by field by each node instead
+    """
+
+    __slots__ = ("items", "needs_dict", "trie", "plan", "saved_steps")
+    paths = None
+
+    def __init__(self, items: dict):
+        self.items = tuple(items.items())
+        self.needs_dict = any(node.needs_dict for node in items.values())
+        self.trie, self.plan = _hoist(self.items)
+        self.saved_steps = sum(node.saved_steps for node in items.values())
+        if self.trie is not None:
+            self.saved_steps += self.trie.saved_steps
+
+    def __call__(self, input_dict: dict):
+        if self.trie is None or type(input_dict) is not dict:
+            return {k: node(input_dict) for k, node in self.items}
+        found = self.trie(input_dict)
+        return {
+            k: (
+                node(input_dict)
+                if start is None
+                else node.finish(found[start:end], input_dict)
+            )
+            for k, node, start, end in self.plan
+        }
+
+
+class _ListNode:
+    """Compiled list of map values"""
+
+    __slots__ = ("nodes", "needs_dict", "saved_steps")
+    paths = None
+
+    def __init__(self, nodes: list):
+        self.nodes = tuple(nodes)
+        self.needs_dict = any(node.needs_dict for node in self.nodes)
+        self.saved_steps = sum(node.saved_steps for node in self.nodes)
+
+    def __call__(self, input_dict: dict):
+        return [node(input_dict) for node in self.nodes]
+
+
+class _CallNode:
+    """Compiled callable map value"""
+
+    __slots__ = ("func",)
+    needs_dict = True
+    paths = None
+    saved_steps = 0
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, input_dict: dict):
+        return self.func(input_dict)
+
+
+_PATH_CACHE = {}
+
+
+def parse_path(text: str):
+    """Splits a dotted glom path into its keys
+
+    Returns None for paths glom has to resolve itself ("*" and "**" segments).
+    Results are cached, so each map string is only parsed once
+    """
+    try:
+        return _PATH_CACHE[text]
+    except KeyError:
+        pass
+    keys = tuple(text.split("."))
+    if "*" in keys or "**" in keys:
+        keys = None
+    _PATH_CACHE[text] = keys
+    return keys
+
+
+def prebuild_spec(spec):
+    """Replaces the path strings of a glom spec with pre-parsed glom Paths
+
+    glom would otherwise turn every string into a Path again on each call
+    """
+    if isinstance(spec, str):
+        return Path.from_text(spec)
+    if type(spec) is dict:
+        return {k: prebuild_spec(v) for k, v in spec.items()}
+    if type(spec) is list:
+        return [prebuild_spec(v) for v in spec]
+    if type(spec) is tuple:
+        return tuple(prebuild_spec(v) for v in spec)
+    return spec
+
+
+def compile_search(keys, search, compiled=None):
+    """Compiles a (keys, search) glom tuple, which returns None when nothing is found
+
+    compiled is the already compiled search, shared by the keys of a merge
+    """
+    if isinstance(keys, str):
+        path = parse_path(keys)
+        if path is not None:
+            return _SearchNode(path, search, compiled)
+    return _RootSpecNode((keys, search))
+
+
+# nodes are stateless, so maps built per instance (like default_map) share the
+# compiled nodes of their path strings
+_STRING_NODES = {}
+
+
+def compile_map_value(value):
+    """Compiles a single map value into an evaluator node
+
+    The type checks done by _MappingMixinBase.process_map_value on every
+    record are done once here, in the same order, so the returned node
+    gives the same result as process_map_value(value, input_dict)
+    """
+    if isinstance(value, IgnoreGlom):
+        return _ConstNode(str(value))
+    if isinstance(value, str):
+        node = _STRING_NODES.get(value) if type(value) is str else None
+        if node is None:
+            keys = parse_path(value)
+            if keys is None:
+                node = _GlomNode(prebuild_spec(value), default=value)
+            else:
+                node = _PathNode(keys, default=value)
+            if type(value) is str:
+                _STRING_NODES[value] = node
+        return node
+    if isinstance(value, tuple):
+        keys, search = value
+        if isinstance(keys, list):
+            return _MergeNode(keys, search)
+        if isinstance(keys, str):
+            return compile_search(keys, search)
+        return _ConstNode(value)
+    if isinstance(value, dict):
+        return compile_map(value)
+    if isinstance(value, list):
+        return _ListNode([compile_map_value(v) for v in value])
+    if isinstance(value, Aggregate):
+        return _AggregateNode(value)
+    if isinstance(value, Lookup):
+        return _LookupNode(value)
+    if isinstance(value, Merge):
+        return _MergeSpecNode(value)
+    if callable(value):
+        return _CallNode(value)
+    return _ConstNode(value)
+
+
+def compile_map(map_dict: dict) -> _DictNode:
+    """Compiles a map into a tree of evaluator nodes
+
+    Calling the result with an input dict is equivalent to
+    _MappingMixinBase.process_map(map_dict, input_dict)
+    """
+    return _DictNode({k: compile_map_value(v) for k, v in map_dict.items()})
+
+
+def column_searches(node) -> tuple:
+    """Returns the _SearchNodes of a (path(s), [{...}]) map value and its dict spec"""
+    searches = node.nodes if type(node) is _MergeNode else (node,)
+    for search in searches:
+        if (
+            type(search) is not _SearchNode
+            or type(search.search) is not _SpecList
+            or type(search.search.node) is not _SpecDict
+        ):
+            raise TypeError('columns need a ("path", [{...}]) map value')
+    return searches, searches[0].search.node
+
+
+########## source generation
+# Optional backend that turns a compiled map into straight line python:
+# paths become .get() calls cached in local variables, [subspec] lists
+# become comprehensions and anything else calls the node it came from.
+
+
+class _SourceGenerator:
+    """Builds the source of a function equivalent to a compiled _DictNode"""
+
+    def __init__(self):
+        self.namespace = {
+            "MISSING": MISSING,
+            "_Stuck": _Stuck,
+            "_step": _step,
+            "_unstick": _unstick,
+            "_combine": _MergeNode._combine,
+            "SKIP": SKIP,
+            "STOP": STOP,
+        }
+        self.blocks = []
+        self.specs = {}
+
+    def ref(self, value) -> str:
+        """Returns a literal for strings and ints, a namespace name otherwise"""
+        if type(value) in (str, int):
+            return repr(value)
+        name = f"_c{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def function(self, node, lines: list) -> str:
+        """Adds a function with the body lines, falling back to node as _fallback"""
+        name = f"_s{len(self.blocks)}"
+        self.blocks.append(None)
+        body = "\n".join(f"    {line}" for line in lines)
+        source = f"def {name}(t, _fallback={self.ref(node)}):\n{body}\n"
+        self.blocks[int(name[2:])] = source
+        return name
+
+    def paths(self, lines: list, target: str, paths: list, is_dict: bool) -> list:
+        """Adds the lookups of a _PrefixTrie over paths, returns the leaf values
+
+        is_dict means target is known to be a dict, so its keys are read with
+        a plain .get()
+        """
+        trie = _PrefixTrie(paths)
+        regs = {0: target}
+        for src, key, index, dst, depth in trie.program:
+            cur, regs[dst] = regs[src], f"r{dst}"
+            get = f"{cur}.get({self.ref(key)}, MISSING)"
+            if src == 0 and is_dict:
+                lines.append(f"r{dst} = {get}")
+            else:
+                step = f"_step({cur}, {self.ref(key)}, {index!r}, {depth})"
+                lines.append(f"r{dst} = {get} if type({cur}) is dict else {step}")
+        leaves = []
+        for register, keys in trie.leaves:
+            if len(keys) == 1 and is_dict:
+                leaves.append(f"r{register}")
+                continue
+            leaves.append(f"v{len(leaves)}")
+            lines.append(
+                f"{leaves[-1]} = r{register} if type(r{register}) is not _Stuck "
+                f"else _unstick(r{register}, {self.ref(keys)})"
+            )
+        return leaves
+
+    def spec(self, node) -> str:
+        """Returns the name of a callable for a compiled glom spec node"""
+        if id(node) not in self.specs:
+            self.specs[id(node)] = self._spec(node)
+        return self.specs[id(node)]
+
+    def _spec(self, node) -> str:
+        if type(node) is _SpecCall:
+            return self.ref(node.func)
+        if type(node) is _SpecPath:
+            lines = []
+            (value,) = self.paths(lines, "t", list(node.paths), False)
+            return self.function(node, lines + [f"return {value}"])
+        if type(node) is _SpecDict:
+            return self.spec_dict(node)
+        if type(node) is _SpecList:
+            return self.spec_list(node)
+        if type(node) is _SpecChain:
+            return self.spec_chain(node)
+        return self.ref(node)
+
+    def spec_dict(self, node: _SpecDict) -> str:
+        lines = ["if type(t) is not dict:", "    return _fallback(t)"]
+        paths = [child.paths[0] for _, child in node.items if type(child) is _SpecPath]
+        leaves = iter(self.paths(lines, "t", paths, True))
+        lines.append("ret = {}")
+        for key, child in node.items:
+            if type(child) is _SpecPath:
+                val = next(leaves)
+            else:
+                val = "val"
+                lines.append(f"val = {self.spec(child)}(t)")
+            lines += [
+                f"if {val} is MISSING:",
+                "    return MISSING",
+                f"if {val} is not SKIP:",
+                f"    ret[{self.ref(key)}] = {val}",
+            ]
+        return self.function(node, lines + ["return ret"])
+
+    def spec_list(self, node: _SpecList) -> str:
+        sub = self.spec(node.node)
+        lines = [
+            "if type(t) is not list and type(t) is not tuple:",
+            "    return _fallback(t)",
+        ]
+        if type(node.node) is _SpecDict:
+            # dict specs never return SKIP or STOP
+            lines.append(f"ret = [{sub}(item) for item in t]")
+            lines.append("return MISSING if MISSING in ret else ret")
+            return self.function(node, lines)
+        lines += [
+            "ret = []",
+            "for item in t:",
+            f"    val = {sub}(item)",
+            "    if val is MISSING:",
+            "        return MISSING",
+            "    if val is SKIP:",
+            "        continue",
+            "    if val is STOP:",
+            "        break",
+            "    ret.append(val)",
+            "return ret",
+        ]
+        return self.function(node, lines)
+
+    def spec_chain(self, node: _SpecChain) -> str:
+        lines = ["res = t"]
+        for child in node.nodes:
+            lines += [
+                f"nxt = {self.spec(child)}(res)",
+                "if nxt is MISSING:",
+                "    return MISSING",
+                "if nxt is STOP:",
+                "    return res",
+                "if nxt is not SKIP:",
+                "    res = nxt",
+            ]
+        return self.function(node, lines + ["return res"])
+
+    def search(self, lines: list, result: str, found: str, node: _SearchNode):
+        """Adds the lines of _SearchNode.finish, storing the result in result"""
+        lines += [
+            f"if {found} is MISSING:",
+            f"    {result} = None",
+            "else:",
+            f"    {result} = {self.spec(node.search)}({found})",
+            f"    if {result} is MISSING:",
+            f"        {result} = None",
+            f"    elif {result} is SKIP or {result} is STOP:",
+            f"        {result} = {found}",
+        ]
+
+    def map(self, compiled: _DictNode, name: str) -> str:
+        """Returns the source of the function for compiled, a top level map"""
+        lines = ["if type(input_dict) is not dict:", "    return _fallback(input_dict)"]
+        paths = []
+        for _, node in compiled.items:
+            if type(node) in (_PathNode, _SearchNode, _MergeNode) and node.paths:
+                paths.extend(node.paths)
+        leaves = iter(self.paths(lines, "input_dict", paths, True))
+        results = []
+        for key, node in compiled.items:
+            result = f"e{len(results)}"
+            if type(node) is _PathNode:
+                value = next(leaves)
+                default = self.ref(node.default)
+                lines.append(f"{result} = {default} if {value} is MISSING else {value}")
+            elif type(node) is _SearchNode:
+                self.search(lines, result, next(leaves), node)
+            elif type(node) is _MergeNode and node.paths:
+                parts = []
+                for search in node.nodes:
+                    parts.append(f"{result}_{len(parts)}")
+                    self.search(lines, parts[-1], next(leaves), search)
+                lines.append(f"{result} = _combine(({', '.join(parts)},))")
+            else:
+                lines.append(f"{result} = {self.ref(node)}(input_dict)")
+            results.append(f"{self.ref(key)}: {result}")
+        lines.append(f"return {{{', '.join(results)}}}")
+        body = "\n".join(f"    {line}" for line in lines)
+        fallback = self.ref(compiled)
+        source = f"def {name}(input_dict, _fallback={fallback}):\n{body}\n"
+        return "\n\n".join(self.blocks + [source])
+
+
+def generate_map(compiled: _DictNode, name: str = "mapped") -> tuple:
+    """Generates a python function equivalent to a compiled map
+
+    Returns (function, source). Inputs that aren't dicts (MappedModels) and
+    specs the generator can't express call back into the compiled nodes.
+    The source is registered with linecache, so tracebacks show the
+    generated lines
+    """
+    generator = _SourceGenerator()
+    source = generator.map(compiled, name)
+    filename = f"<mapped {name}>"
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    namespace = generator.namespace
+    exec(compile(source, filename, "exec"), namespace)
+    return namespace[name], source
+
+
+class _MappingMixinBase(ABC):
+    @property
+    @abstractmethod
+    def output_model(self) -> DefaultBaseModel:
+        return DefaultBaseModel
+
+    @property
+    @abstractmethod
+    def map(self):
+        return self.default_map()
+
+    @classmethod
+    def _class_compiled_map(cls):
+        """Returns the compiled class level map, compiling it on first use
+
+        Returns None when map is a property, as those maps are built per instance
+        """
+        compiled = cls.__dict__.get("_compiled_map")
+        if compiled is None:
+            map_dict = getattr(cls, "map", None)
+            if not isinstance(map_dict, dict):
+                return None
+            compiled = compile_map(map_dict)
+            setattr(cls, "_compiled_map", compiled)
+        return compiled
+
+    @property
+    def compiled_map(self):
+        """Returns the compiled map, cached on the class when map is a class attribute"""
+        compiled = self._class_compiled_map()
+        if compiled is None:
+            compiled = compile_map(self.map)
+        return compiled
+
+    @classmethod
+    def map_source(cls) -> str:
+        """Returns the python source generated for the class map, for debugging"""
+        compiled = cls._class_compiled_map()
+        if compiled is None:
+            raise TypeError(f"{cls.__name__} needs a class level map attribute")
+        return generate_map(compiled, f"map_{cls.__name__}")[1]
+
+    @classmethod
+    def saved_path_steps(cls):
+        """Returns how many path steps per record the class map saves by
+        resolving shared prefixes once, or None when map is a property
+
+        Steps inside list specs are counted once, they are saved for each item
+        """
+        compiled = cls._class_compiled_map()
+        if compiled is None:
+            return None
+        return compiled.saved_steps
+
+    def process_map(self, map_dict: dict, input_dict: dict):
+        return {k: self.process_map_value(v, input_dict) for k, v in map_dict.items()}
+
+    def process_map_value(self, value, input_dict: dict):
+        if isinstance(value, IgnoreGlom):
+            # This needs to be at the top
+            return str(value)
+        if isinstance(value, str):
+            return glom(input_dict, value, default=value)
+
+        if isinstance(value, tuple):
+            keys, search = value
+            if isinstance(keys, list):
+                combined = []
+                for val in keys:
+                    result = glom(input_dict, (val, search), default=None)
+                    if isinstance(result, list):
+                        combined += result
+                    if isinstance(result, str):
+                        combined.append(result)
+                return combined
+            if isinstance(keys, str):
+                return glom(input_dict, value, default=None)
+        if isinstance(value, dict):
+            return self.process_map(value, input_dict)
+        if isinstance(value, list):
+            return [self.process_map_value(v, input_dict) for v in value]
+
+        if callable(value):
+            return value(input_dict)
+        else:
+            return value
+
+
+class MappedModel(DefaultBaseModel, _MappingMixinBase, ABC):
+    """
+    A Pydantic Mapped model class
+
+    ...
+
+    Class Attributes
+    ----------
+    mapped : Model
+        converts a python dict to the corresponding mapped model
+    output_model : DefaultBaseModel
+        return a DefaultBaseModel
+    map : int
+        returns a map of dict keys
+
+    Methods
+    -------
+    default_map(exclude: Union[set, dict]):
+        returns mapped dict keys with optionalexclude keys param
+    """
+
+    @property
+    def mapped(self):
+        compiled = self.compiled_map
+        if compiled.needs_dict or getattr(self, "__exclude_fields__", None):
+            input_dict = self.dict()
+        else:
+            # paths are resolved against the model fields, see _PathNode
+            input_dict = self
+        processed_map = compiled(input_dict)
+        return self.output_model(**processed_map)
+
+    def default_map(self, exclude: Union[set, dict] = None):
+        cls = type(self)
+        if len(self.__dict__) != len(cls.__fields__):
+            # extra or unset fields, only self.dict() knows the keys
+            input_dict = self.dict(exclude=exclude)
+            return {k: k for k in input_dict.keys()}
+        if isinstance(exclude, dict):
+            exclude = (k for k, v in exclude.items() if v is True or v is ...)
+        exclude = frozenset(exclude or ())
+        default_maps = cls.__dict__.get("_default_maps")
+        if default_maps is None:
+            default_maps = {}
+            setattr(cls, "_default_maps", default_maps)
+        default_map = default_maps.get(exclude)
+        if default_map is None:
+            # fields declared with Field(exclude=True) are left out by self.dict(),
+            # which pydantic only supports from 1.9
+            excluded = set(exclude)
+            for k, v in (getattr(cls, "__exclude_fields__", None) or {}).items():
+                if v is True or v is ...:
+                    excluded.add(k)
+            default_map = {k: k for k in cls.__fields__ if k not in excluded}
+            default_maps[exclude] = default_map
+        return dict(default_map)
+
+    @property
+    def output_model(self) -> DefaultBaseModel:
+        return DefaultBaseModel
+
+    @property
+    def map(self):
+        return self.default_map()
+
+
+class MapDictToModel(_MappingMixinBase, ABC):
+    """Leverages Glom to map python dictionaries to a mapped pydantic model
+
+    glom works by by doing nested dictionary searches
+    so instead of data['a']['b']['c']
+    we use glom(data, 'a.b.c')
+
+    This class uses glom to map key value pairs to a Pydantic model Field
+    map: dict = {
+        "Pydantic Model Field": "glom.recursive.lookup"
+        }
+
+    We leverage tuples to collapse values to a list and to merge nested structs
+
+    # nested dictionary structures
+    key: ("lookup.value", [{"nested_key", "nested_key_lookup"}])
+
+    # merged keys
+    key: (["lookup.value"], "loo")
+
+    Example dictionary Input:
+
+        input_dict = {
+                "items": {
+                    "price": 7,
+                    "price2": 7,
+                    "nested": [
+                        {"list_val": 1, "amount": 3.05},
+                        {"list_val": 2, "amount": 4},
+                    ],
+                    "identical": "value to be combined",
+                },
+                "items2": {"identical": "second value to be combined"},
+            }
+    Example Pydantic Model:
+
+        class APydanticModel(BM):
+            my_pydantic_field: int
+            my_nested_fields: list
+            my_collapsible_field: list
+
+    Example MapDictToModel class:
+
+         class MyClass(MapDictToModel):
+            output_model = APydanticModel
+
+            map: dict = {
+                "my_pydantic_field": "items.price",
+                "my_nested_fields": (
+                    "items.nested",
+                    [
+                        {
+                            "my_list_val": "list_val",
+                            "my_amount": "amount",
+                        }
+                    ],
+                ),
+                "my_collapsible_field": (["items", "items2"], "identical"),
+            }
+
+    Usage:
+        my_pydantic_model = MyClass(input_dict).mapped
+        my_pydantic_model.my_pydantic_field
+            result -> 7
+        my_pydantic_model.my_nested_fields
+            result -> [{'my_list_val': 1, 'my_amount': 3.05}, {'my_list_val': 2, 'my_amount': 4}]
+        my_pydantic_model.my_collapsible_field
+            result -> ['value to be combined', 'second value to be combined']
+
+    Batch Usage:
+        my_pydantic_models = MyClass.map_many([input_dict, input_dict])
+        for my_pydantic_model in MyClass.iter_mapped(input_dicts):
+            ...
+        for my_pydantic_model in MyClass.map_parallel(input_dicts, workers=4):
+            ...
+
+    Async Usage:
+        my_pydantic_model = await MyClass(input_dict).amapped(concurrency=10)
+        my_pydantic_models = await MyClass.amap_many(input_dicts, concurrency=10)
+
+    Generated source:
+        set codegen = True on the class to map with a generated python function
+        print(MyClass.map_source())
+
+    Merging:
+        "all_items": Merge(
+            ["line_items.physical_items", "line_items.digital_items"],
+            {"price": "list_price"},
+            key="id",
+        ),
+
+    Aggregation:
+        "summed_discounts": Sum(
+            "line_items.physical_items", Sum("discounts", "discounted_amount")
+        ),
+        "by_product": GroupBy("line_items.physical_items", "product_id"),
+
+    Columnar Usage (needs numpy):
+        columns = MyClass.columns(input_dicts, "my_nested_fields")
+        columns["my_amount"].sum()
+
+    Result cache:
+        set result_cache_size (and optionally result_cache_ttl in seconds) on
+        the class to return the cached model for repeated inputs, like retried
+        webhooks. Cached models are shared, treat them as immutable
+        my_pydantic_model = MyClass.map_raw(request_body)
+        MyClass.cache_stats()
+
+    Incremental remapping:
+        new_model = MyClass.remap(old_model, new_input_dict, old_input_dict)
+
+    Field projection:
+        fields = {"currency": None, "physical_items": {"price"}}
+        MyClass(input_dict).project(fields)
+        MyClass.project_many(input_dicts, {"currency"})
+
+    Lazy output:
+        set lazy = True on the class for mapped to return a LazyMapped proxy,
+        which only maps the fields that are read, like MyClass(input).mapped.price
+    """
+
+    input_dict: dict = None
+    validate: bool = True
+    validate_every: int = None
+    codegen: bool = False
+    result_cache_size: int = None
+    result_cache_ttl: float = None
+    lazy: bool = False
+
+    def __init__(self, input_dict: dict, *args, **kwargs):
+        """
+        Initializes input dictionary and super inits _MappingMixinBase
+        """
+        self.input_dict = input_dict
+        super().__init__(*args, **kwargs)
+
+    @property
+    def mapped(self):
+        try:
+            mapper = self.as_mapper()
+        except TypeError:
+            if self.lazy:
+                return self._instance_mapper().lazy(self.input_dict)
+            if _spec_has(self.map, _is_coroutine_function):
+                raise TypeError(_ASYNC_MAP_ERROR)
+            processed_map = self.compiled_map(self.input_dict)
+            return construct_output(self.output_model, processed_map, self.validate)
+        if self.lazy:
+            return mapper.lazy(self.input_dict)
+        return mapper.apply(self.input_dict)
+
+    def _instance_mapper(self) -> "Mapper":
+        """Returns a Mapper for this instance's map, when they are properties"""
+        return Mapper(
+            self.map,
+            self.output_model,
+            compiled=self.compiled_map,
+            validate=self.validate,
+        )
+
+    @classmethod
+    def as_mapper(cls) -> "Mapper":
+        """Returns a stateless Mapper for this class, built once and cached
+
+        Raises TypeError when map or output_model are properties, as those
+        depend on the instance
+        """
+        mapper = cls.__dict__.get("_mapper")
+        if mapper is None:
+            compiled = cls._class_compiled_map()
+            if compiled is None or isinstance(cls.output_model, property):
+                raise TypeError(
+                    f"{cls.__name__} needs class level map and output_model attributes"
+                )
+            mapper = Mapper(
+                cls.map,
+                cls.output_model,
+                compiled=compiled,
+                validate=cls.validate,
+                validate_every=cls.validate_every,
+                codegen=cls.codegen,
+                result_cache=(
+                    TTLCache(cls.result_cache_size, cls.result_cache_ttl)
+                    if cls.result_cache_size
+                    else None
+                ),
+            )
+            setattr(cls, "_mapper", mapper)
+        return mapper
+
+    @classmethod
+    def remap(
+        cls,
+        previous_output,
+        input_dict: dict,
+        previous_input: dict = None,
+        changed_paths: list = None,
+        validate: bool = None,
+    ):
+        """Maps a new version of an input, only recomputing the fields that
+        read a path changed since previous_input (see Mapper.remap)
+        """
+        return cls.as_mapper().remap(
+            previous_output, input_dict, previous_input, changed_paths, validate
+        )
+
+    @classmethod
+    def map_raw(cls, raw: Union[bytes, str], validate: bool = None):
+        """Maps a raw JSON payload, with result_cache_size set repeated
+        payloads are only hashed, not parsed
+        """
+        return cls.as_mapper().apply_raw(raw, validate)
+
+    @classmethod
+    def cache_stats(cls) -> dict:
+        """Returns the class's result cache stats, empty when it has none"""
+        return cls.as_mapper().cache_stats()
+
+    @classmethod
+    def iter_mapped(cls, input_dicts, validate: bool = None):
+        """Lazily maps an iterable of input dictionaries to output models
+
+        All records share the class's compiled map, no mapper instance is
+        created per record unless map or output_model are properties
+        """
+        try:
+            mapper = cls.as_mapper()
+        except TypeError:
+            return (cls(input_dict).mapped for input_dict in input_dicts)
+        return mapper.iter_mapped(input_dicts, validate)
+
+    @classmethod
+    def map_many(cls, input_dicts, validate: bool = None) -> list:
+        """Maps an iterable of input dictionaries to a list of output models"""
+        return list(cls.iter_mapped(input_dicts, validate))
+
+    def project(self, fields) -> dict:
+        """Maps only the given fields of the input dict, see Mapper.project"""
+        try:
+            mapper = self.as_mapper()
+        except TypeError:
+            return compile_map(project_map(self.map, fields))(self.input_dict)
+        return mapper.project(self.input_dict, fields)
+
+    @classmethod
+    def project_many(cls, input_dicts, fields) -> list:
+        """Maps only the given fields of input dictionaries, see Mapper.project
+
+        Each record gets its own instance when map or output_model are properties
+        """
+        try:
+            mapper = cls.as_mapper()
+        except TypeError:
+            return [cls(input_dict).project(fields) for input_dict in input_dicts]
+        return mapper.project_many(input_dicts, fields)
+
+    async def amapped(self, concurrency: int = None):
+        """Async mapped, the coroutine functions in the map are awaited
+        concurrently, at most concurrency at a time
+        """
+        try:
+            mapper = self.as_mapper()
+        except TypeError:
+            mapper = self._instance_mapper()
+        return await mapper.aapply(self.input_dict, concurrency=concurrency)
+
+    @classmethod
+    async def amap_many(
+        cls, input_dicts, validate: bool = None, concurrency: int = None
+    ) -> list:
+        """Maps input dictionaries awaiting coroutine functions, see Mapper.amap_many
+
+        Each record gets its own instance when map or output_model are properties
+        """
+        try:
+            mapper = cls.as_mapper()
+        except TypeError:
+            return [
+                await cls(input_dict)
+                ._instance_mapper()
+                .aapply(input_dict, validate, concurrency)
+                for input_dict in input_dicts
+            ]
+        return await mapper.amap_many(input_dicts, validate, concurrency)
+
+    @classmethod
+    def map_parallel(
+        cls,
+        input_dicts,
+        workers: int = None,
+        chunksize: int = 100,
+        ordered: bool = True,
+        validate: bool = None,
+    ):
+        """Maps input dictionaries in worker processes, see Mapper.map_parallel
+
+        Each record gets its own instance when map or output_model are
+        properties, the workers then receive the class, which must be picklable
+        """
+        try:
+            mapper = cls.as_mapper()
+        except TypeError:
+            from mapped_schema_parallel import map_instances_chunk, parallel
+
+            chunks = parallel(
+                cls,
+                map_instances_chunk,
+                (validate,),
+                input_dicts,
+                workers,
+                chunksize,
+                ordered,
+            )
+            return (model for models in chunks for model in models)
+        return mapper.map_parallel(input_dicts, workers, chunksize, ordered, validate)
+
+    @classmethod
+    def columns(cls, input_dicts, field: str, dtypes: dict = None) -> dict:
+        """Maps the list items of a field to numpy columns, see Mapper.columns
+
+        Each record gets its own instance when map or output_model are properties
+        """
+        try:
+            mapper = cls.as_mapper()
+        except TypeError:
+            from mapped_schema_columns import map_instance_columns
+
+            return map_instance_columns(cls, input_dicts, field, dtypes)
+        return mapper.columns(input_dicts, field, dtypes)
+
+    @classmethod
+    def columns_parallel(
+        cls,
+        input_dicts,
+        field: str,
+        workers: int = None,
+        chunksize: int = 1000,
+        ordered: bool = True,
+        dtypes: dict = None,
+    ):
+        """Maps columns in worker processes, see Mapper.columns_parallel
+
+        Each record gets its own instance when map or output_model are
+        properties, the workers then receive the class, which must be picklable
+        """
+        try:
+            mapper = cls.as_mapper()
+        except TypeError:
+            from mapped_schema_parallel import instance_columns_chunk, parallel
+            from mapped_schema_shared import SharedColumns, unlink_shared
+
+            chunks = parallel(
+                cls,
+                instance_columns_chunk,
+                (field, dtypes),
+                input_dicts,
+                workers,
+                chunksize,
+                ordered,
+                discard=unlink_shared,
+            )
+            return (SharedColumns(*shared) for shared in chunks)
+        return mapper.columns_parallel(
+            input_dicts, field, workers, chunksize, ordered, dtypes
+        )
+
+
+_IMMUTABLE_DEFAULTS = (type(None), bool, int, float, complex, str, bytes, frozenset)
+
+
+class _TrustedConstructor:
+    """Builds an output model through construct(), skipping pydantic validation
+
+    Field defaults are looked up once per model instead of on every record, and
+    the DefaultBaseModel nones_to_default rule is still applied. Values are
+    stored as the map produced them, so nested models stay plain dicts
+    """
+
+    __slots__ = ("model", "fields")
+
+    def __init__(self, model):
+        nones_to_default = getattr(model, "__nones_to_default__", {})
+        fields = []
+        for name, field in model.__fields__.items():
+            default, factory = MISSING, None
+            if field.default_factory is None and isinstance(
+                field.default, _IMMUTABLE_DEFAULTS
+            ):
+                default = field.default
+            elif not field.required:
+                factory = field.get_default
+            fill_nones = name in nones_to_default
+            fields.append((name, field.alias, default, factory, fill_nones))
+        self.model = model
+        self.fields = tuple(fields)
+
+    def __call__(self, values: dict):
+        fields_values = {}
+        fields_set = set()
+        for name, alias, default, factory, fill_nones in self.fields:
+            value = values.get(alias, MISSING)
+            if value is MISSING and alias != name:
+                value = values.get(name, MISSING)
+            if value is MISSING or (value is None and fill_nones):
+                if value is MISSING:
+                    if factory is None and default is MISSING:
+                        continue
+                else:
+                    fields_set.add(name)
+                value = default if factory is None else factory()
+            else:
+                fields_set.add(name)
+            fields_values[name] = value
+        return self.model.construct(_fields_set=fields_set, **fields_values)
+
+
+_TRUSTED_CONSTRUCTORS = {}
+
+
+def construct_output(output_model, values: dict, validate: bool = True):
+    """Builds the output model from processed map values
+
+    With validate=False pydantic models are built through construct(), which
+    is only safe for input from a trusted upstream
+    """
+    is_model = isinstance(output_model, type) and issubclass(output_model, BM)
+    if validate or not is_model:
+        return output_model(**values)
+    constructor = _TRUSTED_CONSTRUCTORS.get(output_model)
+    if constructor is None:
+        constructor = _TRUSTED_CONSTRUCTORS[output_model] = _TrustedConstructor(
+            output_model
+        )
+    return constructor(values)
+
+
+########## async callables
+# Coroutine functions in a map are called like any callable while the map is
+# evaluated, the coroutines they return are left in the output and awaited
+# together afterwards. So their results can't be passed to further glom
+# spec steps, they have to be the value of a field or of a dict spec key
+
+
+def _spec_has(spec, test) -> bool:
+    """Returns True when test(part) is true for a part of a map or glom spec"""
+    if test(spec):
+        return True
+    if isinstance(spec, dict):
+        return any(_spec_has(value, test) for value in spec.values())
+    if isinstance(spec, (list, tuple)):
+        return any(_spec_has(value, test) for value in spec)
+    if isinstance(spec, Coalesce):
+        return any(_spec_has(value, test) for value in spec.subspecs)
+    if isinstance(spec, Aggregate):
+        return _spec_has((spec.path, spec.value, spec.key), test)
+    if isinstance(spec, Merge):
+        return _spec_has((spec.keys, spec.search, spec.key), test)
+    return False
+
+
+def _is_coroutine_function(spec) -> bool:
+    return inspect.iscoroutinefunction(spec) or inspect.iscoroutinefunction(
+        getattr(spec, "__call__", None)
+    )
+
+
+_ASYNC_MAP_ERROR = (
+    "the map has coroutine functions, map it with aapply, amap_many or amapped"
+)
+
+
+def collect_nested(value, found: list, test):
+    """Appends (container, key, item) for the items nested in value that pass test"""
+    if type(value) is dict:
+        items = value.items()
+    elif type(value) is list:
+        items = enumerate(value)
+    else:
+        return
+    for key, item in items:
+        if test(item):
+            found.append((value, key, item))
+        else:
+            collect_nested(item, found, test)
+
+
+########## incremental remapping
+# The paths each top level map value reads are recorded once per map, so a
+# new version of an input only recomputes the values under the paths that
+# changed. Values whose paths can't be known (callables, glom specs) are
+# always recomputed.
+
+
+def _spec_dependencies(node):
+    """Returns the paths a compiled glom spec starts from, None when unknown"""
+    if type(node) is _SpecPath or (type(node) is _SpecChain and node.paths):
+        return frozenset(node.paths)
+    return None
+
+
+def _node_dependencies(node):
+    """Returns the input paths a compiled map value reads, None when unknown"""
+    kind = type(node)
+    if kind is _ConstNode:
+        return frozenset()
+    if kind is _PathNode or kind is _SearchNode:
+        return frozenset(node.paths)
+    if kind is _AggregateNode:
+        return None if node.path is None else _spec_dependencies(node.path)
+    if kind is _LookupNode:
+        return _spec_dependencies(node.key)
+    if kind is _MergeSpecNode:
+        return frozenset(node.paths) if node.paths else None
+    if kind is _DictNode:
+        children = [child for _, child in node.items]
+    elif kind is _MergeNode or kind is _ListNode:
+        children = node.nodes
+    else:
+        return None
+    paths = set()
+    for child in children:
+        child_paths = _node_dependencies(child)
+        if child_paths is None:
+            return None
+        paths |= child_paths
+    return frozenset(paths)
+
+
+def map_dependencies(compiled: _DictNode) -> dict:
+    """Returns {map key: input paths as key tuples} for a compiled map
+
+    The paths are None for values that may read anything in the input
+    """
+    return {key: _node_dependencies(node) for key, node in compiled.items}
+
+
+def diff_paths(old, new, prefix: tuple = ()) -> list:
+    """Returns the key tuples of the values that differ between two inputs
+
+    Dicts are compared key by key, anything else (lists included) as a whole
+    """
+    if type(old) is not dict or type(new) is not dict:
+        return [] if old == new else [prefix]
+    changed = []
+    for key in old.keys() | new.keys():
+        old_value, new_value = old.get(key, MISSING), new.get(key, MISSING)
+        if old_value is new_value:
+            continue
+        if type(old_value) is dict and type(new_value) is dict:
+            changed += diff_paths(old_value, new_value, prefix + (key,))
+        elif old_value != new_value:
+            changed.append(prefix + (key,))
+    return changed
+
+
+def _affected_keys(dependencies: dict, changed) -> list:
+    """Returns the map keys whose paths are above, at or below a changed path"""
+    changed = set(changed)
+    below = {path[:i] for path in changed for i in range(len(path) + 1)}
+    return [
+        key
+        for key, paths in dependencies.items()
+        if paths is None
+        or any(
+            path in below or any(path[:i] in changed for i in range(len(path)))
+            for path in paths
+        )
+    ]
+
+
+def _validate_fields(output_model, previous, values: dict) -> dict:
+    """Validates some mapped values of an existing model
+
+    Returns {field name: value} for model.copy(update=...). The model's pre
+    root validators run on the given values only, so remap only calls this
+    for models whose only one is nones_to_default
+    """
+    for validator in output_model.__pre_root_validators__:
+        values = validator(output_model, values)
+    fields = {}
+    for field in output_model.__fields__.values():
+        fields[field.name] = fields[field.alias] = field
+    current = dict(previous)
+    update = {}
+    errors = []
+    for key, value in values.items():
+        field = fields.get(key)
+        if field is None:
+            continue
+        value, error = field.validate(value, current, loc=field.alias, cls=output_model)
+        if error:
+            errors.append(error)
+        else:
+            update[field.name] = current[field.name] = value
+    if errors:
+        raise ValidationError(errors, output_model)
+    return update
+
+
+########## lazy output
+
+
+def _lazy_fields(output_model, compiled: _DictNode):
+    """Returns {field name: (map key, node)} of a model's mapped fields
+
+    Returns None when the fields can't be validated one at a time, like with
+    root validators that may fill a field from others, the fields missing
+    from the map have (None, None)
+    """
+    is_model = isinstance(output_model, type) and issubclass(output_model, BM)
+    if (
+        not is_model
+        or output_model.__post_root_validators__
+        or _has_pre_root_validators(output_model)
+    ):
+        return None
+    nodes = dict(compiled.items)
+    fields = {}
+    for name, field in output_model.__fields__.items():
+        key = field.alias if field.alias in nodes else name
+        fields[name] = (key, nodes[key]) if key in nodes else (None, None)
+    return fields
+
+
+class LazyMapped:
+    """Output model proxy that maps each field on its first access
+
+    Reading a field evaluates and validates only that field's map value, and
+    memoizes it. Anything else, like dict(), json() or comparisons, maps and
+    validates the whole model first and is then read from it
+    """
+
+    __slots__ = ("_mapper", "_input_dict", "_validate", "_values", "_fields", "_model")
+
+    def __init__(self, mapper: "Mapper", input_dict: dict, validate: bool):
+        self._mapper = mapper
+        self._input_dict = input_dict
+        self._validate = validate
+        self._values = {}
+        self._fields = {}
+        self._model = None
+
+    def __repr__(self):
+        evaluated = ", ".join(self._fields)
+        return f"LazyMapped({self._mapper.output_model.__name__}, [{evaluated}])"
+
+    def __getattr__(self, name: str):
+        if name in LazyMapped.__slots__:
+            # unset while copy and pickle build a new instance
+            raise AttributeError(name)
+        fields = self._mapper.lazy_fields
+        if self._model is None and fields is not None and name in fields:
+            try:
+                return self._fields[name]
+            except KeyError:
+                value = self._fields[name] = self._field(name, *fields[name])
+                return value
+        return getattr(self._full(), name)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyMapped):
+            other = other._full()
+        return self._full() == other
+
+    def __iter__(self):
+        return iter(self._full())
+
+    def _value(self, key, node):
+        value = self._values.get(key, MISSING)
+        if value is MISSING:
+            if self._mapper.has_lookups:
+                evaluate = lambda input_dict: {key: node(input_dict)}
+                value = _evaluate_batch(evaluate, [self._input_dict])[0][key]
+            else:
+                value = node(self._input_dict)
+            self._values[key] = value
+        return value
+
+    def _field(self, name: str, key, node):
+        model = self._mapper.output_model
+        if key is None:
+            return model.__fields__[name].get_default()
+        value = self._value(key, node)
+        if self._validate:
+            return _validate_fields(model, self._fields, {key: value})[name]
+        if value is None and name in getattr(model, "__nones_to_default__", {}):
+            return model.__fields__[name].get_default()
+        return value
+
+    def _full(self):
+        """Returns the whole output model, mapping the fields not read yet"""
+        if self._model is None:
+            values = self._values
+            missing = [
+                (k, node) for k, node in self._mapper.compiled.items if k not in values
+            ]
+
+            def evaluate(input_dict: dict) -> dict:
+                return {key: node(input_dict) for key, node in missing}
+
+            if self._mapper.has_lookups:
+                values.update(_evaluate_batch(evaluate, [self._input_dict])[0])
+            else:
+                values.update(evaluate(self._input_dict))
+            self._model = construct_output(
+                self._mapper.output_model,
+                {key: values[key] for key, _ in self._mapper.compiled.items},
+                self._validate,
+            )
+        return self._model
+
+
+########## field projection
+# fields are a set of map keys, or a dict of {map key: nested fields or None}
+# that carries into the dicts of nested maps and glom specs, so
+# {"physical_items": {"price"}} only maps the price of each item
+
+
+def _projection_key(fields):
+    """Returns fields as a hashable key, nested fields included"""
+    if fields is None or fields is True:
+        return None
+    if isinstance(fields, dict):
+        return frozenset((k, _projection_key(v)) for k, v in fields.items())
+    return frozenset((k, None) for k in fields)
+
+
+def _project_spec(spec, fields: frozenset):
+    """Returns the glom spec with its dicts only building the given fields
+
+    Specs whose output can't be projected (callables, Coalesce) are kept
+    whole
+    """
+    if fields is None:
+        return spec
+    if type(spec) is dict:
+        if any(type(k) in (Spec, TType) for k in spec):
+            return spec
+        nested = dict(fields)
+        return {k: _project_spec(v, nested[k]) for k, v in spec.items() if k in nested}
+    if type(spec) is list and len(spec) == 1:
+        return [_project_spec(spec[0], fields)]
+    if type(spec) is tuple and spec:
+        return spec[:-1] + (_project_spec(spec[-1], fields),)
+    if isinstance(spec, Merge) and spec.search is not None:
+        search = _project_spec(spec.search, fields)
+        return Merge(spec.keys, search, spec.key, spec.keep)
+    return spec
+
+
+def project_map(map_dict: dict, fields) -> dict:
+    """Returns the map with only the given fields, see field projection above
+
+    Raises KeyError for fields the map doesn't have
+    """
+    return _project_map(map_dict, _projection_key(fields))
+
+
+def _project_map(map_dict: dict, fields: frozenset) -> dict:
+    nested = dict(fields)
+    unknown = nested.keys() - map_dict.keys()
+    if unknown:
+        raise KeyError(f"Fields not in the map: {sorted(unknown)}")
+    projected = {}
+    for key, value in map_dict.items():
+        if key not in nested:
+            continue
+        subfields = nested[key]
+        if subfields is None or isinstance(value, IgnoreGlom):
+            projected[key] = value
+        elif type(value) is dict:
+            projected[key] = _project_map(value, subfields)
+        elif type(value) is tuple and len(value) == 2:
+            keys, search = value
+            projected[key] = (keys, _project_spec(search, subfields))
+        elif isinstance(value, Merge):
+            projected[key] = _project_spec(value, subfields)
+        else:
+            projected[key] = value
+    return projected
+
+
+########## dead map keys
+# Map keys the output model has no field for are computed and then dropped
+# by pydantic, so they are left out of the compiled map when the model
+# ignores extra fields and has no pre root validators that could read them
+
+
+def _model_fields(model) -> dict:
+    """Returns {alias and name: field} of a model whose map keys can be pruned"""
+    if not (isinstance(model, type) and issubclass(model, BM)):
+        return None
+    if model.__config__.extra != Extra.ignore or _has_pre_root_validators(model):
+        return None
+    fields = {}
+    for field in model.__fields__.values():
+        fields[field.name] = fields[field.alias] = field
+    return fields
+
+
+def _prune_value(value, field, dropped: list, prefix: str):
+    """Prunes the dicts of a map value or glom spec filling a nested model field"""
+    if field.shape not in (SHAPE_SINGLETON, SHAPE_LIST):
+        return value
+    fields = _model_fields(field.type_)
+    if fields is None or isinstance(value, IgnoreGlom):
+        return value
+    if type(value) is dict:
+        if any(type(k) in (Spec, TType) for k in value):
+            return value
+        pruned = {}
+        for key, item in value.items():
+            if key in fields:
+                pruned[key] = _prune_value(
+                    item, fields[key], dropped, f"{prefix}{key}."
+                )
+            else:
+                dropped.append(f"{prefix}{key}")
+        return pruned
+    if type(value) is list and len(value) == 1:
+        return [_prune_value(value[0], field, dropped, prefix)]
+    if type(value) is tuple and value:
+        return value[:-1] + (_prune_value(value[-1], field, dropped, prefix),)
+    if isinstance(value, Merge) and value.search is not None:
+        search = _prune_value(value.search, field, dropped, prefix)
+        return Merge(value.keys, search, value.key, value.keep)
+    return value
+
+
+def prune_map(map_dict: dict, output_model, nested: bool = True) -> tuple:
+    """Returns (map, dropped keys) without the keys output_model would drop
+
+    nested also prunes the maps and glom specs filling nested models, which
+    changes the nested dicts of models built without validation
+    """
+    fields = _model_fields(output_model)
+    if fields is None:
+        return map_dict, []
+    dropped = []
+    pruned = {}
+    for key, value in map_dict.items():
+        if key not in fields:
+            dropped.append(key)
+        elif nested:
+            pruned[key] = _prune_value(value, fields[key], dropped, f"{key}.")
+        else:
+            pruned[key] = value
+    return pruned, dropped
+
+
+_PRUNE_WARNINGS = set()
+
+
+def _warn_dead_keys(map_dict: dict, output_model, dropped: list):
+    """Warns once per model about skipped map keys and fields the map never fills"""
+    fields = output_model.__fields__.values()
+    unfilled = [
+        f.name for f in fields if f.alias not in map_dict and f.name not in map_dict
+    ]
+    message = []
+    if dropped:
+        message.append(f"skips map keys it has no field for: {', '.join(dropped)}")
+    if unfilled:
+        message.append(f"has fields the map never fills: {', '.join(unfilled)}")
+    key = (output_model, tuple(message))
+    if message and key not in _PRUNE_WARNINGS:
+        _PRUNE_WARNINGS.add(key)
+        warnings.warn(
+            f"{output_model.__name__} {', and '.join(message)}",
+            stacklevel=_caller_stacklevel(),
+        )
+
+
+def _caller_stacklevel() -> int:
+    """Returns the warnings.warn stacklevel of the first caller outside this
+    module, like the code calling Mapper() or the as_mapper() of a mapping class
+    """
+    frame = inspect.currentframe().f_back
+    level = 1
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+        level += 1
+    return level
+
+
+########## result cache
+
+
+def _content_key(input_dict: dict):
+    """Returns a blake2b digest of input_dict pickled
+
+    One pass in C over the input. Unlike JSON, pickle tells {1: x} from
+    {"1": x} and tuples from lists, equal inputs with keys in another order
+    are only a cache miss. Returns None, so the result isn't cached, for
+    inputs that can't be pickled
+    """
+    try:
+        data = pickle.dumps(input_dict, pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return None
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+########## batched lookups
+
+
+def _evaluate_batch(evaluate, input_dicts) -> list:
+    """Evaluates input dicts collecting their Lookups, then loads each Lookup's
+    keys with one loader call and fills in the values
+    """
+    batch = {}
+    token = _LOOKUP_BATCH.set(batch)
+    try:
+        processed = [evaluate(input_dict) for input_dict in input_dicts]
+    finally:
+        _LOOKUP_BATCH.reset(token)
+    if batch:
+        loaded = {lookup: lookup.load(list(keys)) for lookup, keys in batch.items()}
+        found = []
+        for values in processed:
+            collect_nested(values, found, lambda item: type(item) is _Pending)
+        for container, key, pending in found:
+            container[key] = loaded[pending.lookup][pending.key]
+    return processed
+
+
+def iter_chunks(iterable, size: int):
+    """Yields lists of up to size items from iterable"""
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, size))
+
+
+class Mapper:
+    """A stateless, thread safe mapper built once from a map and an output model
+
+    Unlike MapDictToModel, the input dict is passed to each call instead of
+    being stored, so one instance can be shared between threads and reused
+    for every record
+
+    Usage:
+        mapper = Mapper(MyClass.map, APydanticModel)
+        my_pydantic_model = mapper.apply(input_dict)
+
+        # or from an existing MapDictToModel subclass
+        mapper = MyClass.as_mapper()
+
+    Trusted input:
+        validate=False builds output models with construct() instead of running
+        pydantic validation, it can also be passed per call. validate_every=N
+        still fully validates 1 in N of those records as a safety net
+
+    Generated source:
+        codegen=True maps records with a python function generated from the
+        map instead of the compiled nodes, print(mapper.source) to read it
+
+    Lookups:
+        the Lookups of a map are loaded once per batch, iter_mapped batches
+        lookup_batch_size records at a time
+
+    Dead map keys:
+        map keys the output model has no field for aren't evaluated when it
+        ignores extra fields, nested models included when validate is on.
+        A warning lists them once, with the fields the map never fills
+
+    Incremental remapping:
+        new_model = mapper.remap(old_model, new_input_dict, old_input_dict)
+        only recomputes the map values that read a path that changed between
+        the two inputs, or the dotted paths given as changed_paths
+
+    Lazy output:
+        lazy_model = mapper.lazy(input_dict) maps each field when it's first
+        read, lazy_model.dict() maps and validates the rest
+
+    Field projection:
+        fields = {"currency": None, "physical_items": {"price"}}
+        mapper.project(input_dict, fields)
+        returns a dict of only those fields, the map values of the others are
+        never evaluated. project_many does the same for many input dicts
+
+    Result cache:
+        result_cache=TTLCache(maxsize, ttl) returns the model built for an
+        identical input instead of mapping it again. The model is shared by
+        every call that hits it, so it must be treated as immutable: copy it
+        before changing it. Inputs are keyed by a blake2b hash of their
+        pickle, apply_raw(payload) hashes the raw bytes (str payloads encoded
+        to utf-8) and only parses them on a miss
+    """
+
+    lookup_batch_size: int = 1000
+
+    def __init__(
+        self,
+        map: dict,
+        output_model,
+        compiled=None,
+        validate: bool = True,
+        validate_every: int = None,
+        codegen: bool = False,
+        result_cache: TTLCache = None,
+    ):
+        self.map = map
+        self.output_model = output_model
+        pruned, dropped = prune_map(map, output_model, nested=validate)
+        if (
+            isinstance(output_model, type)
+            and issubclass(output_model, BM)
+            and not _has_pre_root_validators(output_model)
+        ):
+            _warn_dead_keys(map, output_model, dropped)
+        if dropped:
+            compiled = compile_map(pruned)
+        self.compiled = compiled if compiled is not None else compile_map(map)
+        self.validate = validate
+        self.validate_every = validate_every
+        self.codegen = codegen
+        self.result_cache = result_cache
+        self.is_async = _spec_has(map, _is_coroutine_function)
+        self.has_lookups = _spec_has(map, lambda spec: isinstance(spec, Lookup))
+        self.dependencies = map_dependencies(self.compiled)
+        self.lazy_fields = _lazy_fields(output_model, self.compiled)
+        self._projections = {}
+        self._records = itertools.count(1)
+        self._generate()
+
+    def __repr__(self):
+        return f"Mapper(output_model={self.output_model.__name__})"
+
+    def __getstate__(self):
+        # generated functions can't be pickled, they are generated again
+        state = self.__dict__.copy()
+        del state["evaluate"], state["source"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._generate()
+
+    def _generate(self):
+        self.evaluate, self.source = self.compiled, None
+        if self.codegen:
+            name = f"map_to_{self.output_model.__name__}"
+            self.evaluate, self.source = generate_map(self.compiled, name)
+
+    @property
+    def saved_path_steps(self) -> int:
+        """Path steps per record saved by resolving shared prefixes once"""
+        return self.compiled.saved_steps
+
+    def _should_validate(self, validate: bool = None) -> bool:
+        if validate is None:
+            validate = self.validate
+        if validate or not self.validate_every:
+            return validate
+        return next(self._records) % self.validate_every == 0
+
+    def _check_sync(self):
+        """Raises TypeError for async maps, their models would hold coroutines"""
+        if self.is_async:
+            raise TypeError(_ASYNC_MAP_ERROR)
+
+    def apply(self, input_dict: dict, validate: bool = None):
+        """Maps a single input dictionary to the output model"""
+        self._check_sync()
+        if self.result_cache is not None:
+            return self._cached(_content_key(input_dict), input_dict, validate)
+        return self._apply(input_dict, self._should_validate(validate))
+
+    def apply_raw(self, raw: Union[bytes, str], validate: bool = None):
+        """Maps a raw JSON payload, cached by the hash of its bytes"""
+        self._check_sync()
+        if self.result_cache is None:
+            return self._apply(json.loads(raw), self._should_validate(validate))
+        data = raw.encode() if isinstance(raw, str) else raw
+        key = hashlib.blake2b(data, digest_size=16).digest()
+        return self._cached(key, raw, validate)
+
+    def cache_stats(self) -> dict:
+        """Returns the result cache's hit, miss and eviction counts"""
+        if self.result_cache is None:
+            return {}
+        return self.result_cache.stats()
+
+    def _cached(self, key: bytes, input_dict, validate: bool = None):
+        """Returns the model cached for key, mapping input_dict on a miss
+
+        The cached model is returned as it is, copying it cost more than
+        mapping most inputs again
+
+        input_dict may be raw JSON bytes, which are only parsed on a miss
+        """
+        validate = self._should_validate(validate)
+        if key is None:
+            return self._apply(input_dict, validate)
+        # models built with construct() aren't returned for validated calls
+        key = (key, validate)
+        model = self.result_cache.get(key)
+        if model is None:
+            if isinstance(input_dict, (bytes, bytearray, str)):
+                input_dict = json.loads(input_dict)
+            model = self._apply(input_dict, validate)
+            self.result_cache.set(key, model)
+        return model
+
+    def _apply(self, input_dict: dict, validate: bool):
+        """Maps input_dict, validate is already decided by _should_validate"""
+        if self.has_lookups:
+            values = _evaluate_batch(self.evaluate, [input_dict])[0]
+        else:
+            values = self.evaluate(input_dict)
+        return construct_output(self.output_model, values, validate)
+
+    def lazy(self, input_dict: dict, validate: bool = None) -> LazyMapped:
+        """Returns a LazyMapped proxy that maps each field on its first access"""
+        self._check_sync()
+        return LazyMapped(self, input_dict, self._should_validate(validate))
+
+    def projection(self, fields):
+        """Returns the compiled map of only the given fields, built once per fields"""
+        key = _projection_key(fields)
+        compiled = self._projections.get(key)
+        if compiled is None:
+            compiled = self._projections[key] = compile_map(_project_map(self.map, key))
+        return compiled
+
+    def project(self, input_dict: dict, fields) -> dict:
+        """Maps only the given fields of a single input dictionary
+
+        Returns the mapped values as a dict, without building the output model
+        """
+        return self.project_many([input_dict], fields)[0]
+
+    def project_many(self, input_dicts, fields) -> list:
+        """Maps only the given fields of input dictionaries, see project"""
+        compiled = self.projection(fields)
+        if self.has_lookups:
+            return _evaluate_batch(compiled, input_dicts)
+        return [compiled(input_dict) for input_dict in input_dicts]
+
+    def remap(
+        self,
+        previous_output,
+        input_dict: dict,
+        previous_input: dict = None,
+        changed_paths: list = None,
+        validate: bool = None,
+    ):
+        """Maps a new version of an input, reusing the values of previous_output
+
+        Only the map values reading a path changed since previous_input (or
+        one of the dotted changed_paths) are recomputed, the result is a copy
+        of previous_output with those fields updated. Output models with root
+        validators (besides nones_to_default) or extra="forbid" are mapped in
+        full like apply, as their validators read every field
+        """
+        self._check_sync()
+        if changed_paths is not None:
+            changed = [tuple(path.split(".")) for path in changed_paths]
+        elif previous_input is not None:
+            changed = diff_paths(previous_input, input_dict)
+        else:
+            return self.apply(input_dict, validate)
+        model = self.output_model
+        if (
+            not isinstance(previous_output, BM)
+            or type(previous_output) is not model
+            or model.__post_root_validators__
+            or _has_pre_root_validators(model)
+            or model.__config__.extra == "forbid"
+        ):
+            return self.apply(input_dict, validate)
+        keys = _affected_keys(self.dependencies, changed)
+        if not keys:
+            return previous_output.copy()
+        nodes = [(key, node) for key, node in self.compiled.items if key in keys]
+
+        def evaluate(input_dict: dict) -> dict:
+            return {key: node(input_dict) for key, node in nodes}
+
+        if self.has_lookups:
+            values = _evaluate_batch(evaluate, [input_dict])[0]
+        else:
+            values = evaluate(input_dict)
+        if self._should_validate(validate):
+            return previous_output.copy(
+                update=_validate_fields(model, previous_output, values)
+            )
+        constructed = construct_output(model, values, validate=False)
+        return previous_output.copy(
+            update={
+                name: getattr(constructed, name) for name in constructed.__fields_set__
+            }
+        )
+
+    def iter_mapped(self, input_dicts, validate: bool = None):
+        """Lazily maps an iterable of input dictionaries to output models
+
+        Maps with Lookups are evaluated lookup_batch_size records at a time
+        """
+        self._check_sync()
+        output_model = self.output_model
+        if self.result_cache is not None:
+            for input_dict in input_dicts:
+                yield self.apply(input_dict, validate)
+            return
+        if self.has_lookups:
+            for chunk in iter_chunks(input_dicts, self.lookup_batch_size):
+                for values in _evaluate_batch(self.evaluate, chunk):
+                    yield construct_output(
+                        output_model, values, self._should_validate(validate)
+                    )
+            return
+        evaluate = self.evaluate
+        for input_dict in input_dicts:
+            yield construct_output(
+                output_model, evaluate(input_dict), self._should_validate(validate)
+            )
+
+    def map_many(self, input_dicts, validate: bool = None) -> list:
+        """Maps an iterable of input dictionaries to a list of output models"""
+        return list(self.iter_mapped(input_dicts, validate))
+
+    async def aapply(
+        self, input_dict: dict, validate: bool = None, concurrency: int = None
+    ):
+        """Maps a single input dictionary, awaiting the map's coroutine functions
+
+        Their coroutines run concurrently, at most concurrency at a time
+        """
+        return (await self.amap_many([input_dict], validate, concurrency))[0]
+
+    async def amap_many(
+        self, input_dicts, validate: bool = None, concurrency: int = None
+    ) -> list:
+        """Maps input dictionaries, awaiting the coroutines of all of them together
+
+        Synchronous map values are evaluated as usual, maps without coroutine
+        functions don't walk their output looking for awaitables
+        """
+        if self.has_lookups:
+            processed = _evaluate_batch(self.evaluate, input_dicts)
+        else:
+            processed = [self.evaluate(input_dict) for input_dict in input_dicts]
+        if self.is_async:
+            # the runtime extras import this module, so they're imported on use
+            from mapped_schema_async import await_values
+
+            await await_values(processed, concurrency)
+        return [
+            construct_output(self.output_model, values, self._should_validate(validate))
+            for values in processed
+        ]
+
+    def map_parallel(
+        self,
+        input_dicts,
+        workers: int = None,
+        chunksize: int = 100,
+        ordered: bool = True,
+        validate: bool = None,
+    ):
+        """Maps input dictionaries in a pool of worker processes
+
+        Returns an iterator of output models, which are mapped chunksize
+        records at a time. Each worker receives this mapper once when it
+        starts, only the chunks of records are sent with the tasks.
+        ordered=False yields the models of each chunk as soon as it is done
+        instead of in input order. The map and output model must be
+        picklable, so callables in the map need to be module level functions
+        """
+        self._check_sync()
+        from mapped_schema_parallel import map_chunk, parallel
+
+        chunks = parallel(
+            self, map_chunk, (validate,), input_dicts, workers, chunksize, ordered
+        )
+        for models in chunks:
+            yield from models
+
+    def columns_parallel(
+        self,
+        input_dicts,
+        field: str,
+        workers: int = None,
+        chunksize: int = 1000,
+        ordered: bool = True,
+        dtypes: dict = None,
+    ):
+        """Maps the list items of a field to columns in worker processes
+
+        Yields a SharedColumns per chunk of input dictionaries. Workers write
+        the columns into shared memory and the parent reads them in place,
+        so the results aren't pickled back. Close each SharedColumns (or use
+        it as a context manager) to free its shared memory
+        """
+        from mapped_schema_columns import column_dtypes
+        from mapped_schema_parallel import columns_chunk, parallel
+        from mapped_schema_shared import SharedColumns, unlink_shared
+
+        dtypes = {**column_dtypes(self.output_model, field), **(dtypes or {})}
+        chunks = parallel(
+            self,
+            columns_chunk,
+            (field, dtypes),
+            input_dicts,
+            workers,
+            chunksize,
+            ordered,
+            discard=unlink_shared,
+        )
+        for shared in chunks:
+            yield SharedColumns(*shared)
+
+    def columns(self, input_dicts, field: str, dtypes: dict = None) -> dict:
+        """Maps the list items of a ("path", [{...}]) field to numpy columns
+
+        Returns {key: numpy masked array} without building any models. The
+        dtypes default to the types of the item model of the output field,
+        e.g. List[RCItems] gives an int64 quantity and a float64 price column
+        """
+        from mapped_schema_columns import column_dtypes, map_columns
+
+        node = dict(self.compiled.items)[field]
+        dtypes = {**column_dtypes(self.output_model, field), **(dtypes or {})}
+        return map_columns(node, input_dicts, dtypes)
+
+
+class MapGroup:
+    """Applies several maps to the same input, walking the input once
+
+    The top level paths of every map share one _PrefixTrie, so adapters that
+    read the same document (line items, addresses, totals...) resolve each
+    shared prefix once per record instead of once per adapter. The Lookups
+    of all the maps are loaded together, once per batch of records, so a
+    Lookup used by several adapters calls its loader once for all of them
+
+    Usage:
+        group = MapGroup(BCLineItems, BCAddresses, BCTotals)
+        line_items, addresses, totals = group.apply(input_dict)
+
+    Accepts MapDictToModel subclasses and Mappers, each one keeps its own
+    output model and validation settings. Mappers with generated source
+    evaluate it instead of sharing the trie, and mappers with a result cache
+    are applied on their own so their cache is used
+    """
+
+    def __init__(self, *mappers):
+        self.mappers = tuple(
+            mapper if isinstance(mapper, Mapper) else mapper.as_mapper()
+            for mapper in mappers
+        )
+        for mapper in self.mappers:
+            mapper._check_sync()
+        # indexes of the mappers sharing the trie
+        self.shared = tuple(
+            index
+            for index, mapper in enumerate(self.mappers)
+            if mapper.result_cache is None and mapper.evaluate is mapper.compiled
+        )
+        items = []
+        for index in self.shared:
+            items.extend(
+                ((index, k), node) for k, node in self.mappers[index].compiled.items
+            )
+        self.trie, self.plan = _hoist(items)
+        self.has_lookups = any(
+            mapper.has_lookups and mapper.result_cache is None
+            for mapper in self.mappers
+        )
+
+    def __repr__(self):
+        names = ", ".join(mapper.output_model.__name__ for mapper in self.mappers)
+        return f"MapGroup({names})"
+
+    @property
+    def saved_path_steps(self) -> int:
+        """Path steps per record saved compared to applying each map on its own"""
+        saved = sum(mapper.saved_path_steps for mapper in self.mappers)
+        if self.trie is None:
+            return saved
+        # the maps' own top level tries are replaced by the shared one
+        own = sum(
+            mapper.compiled.trie.saved_steps
+            for mapper in map(self.mappers.__getitem__, self.shared)
+            if mapper.compiled.trie is not None
+        )
+        return saved - own + self.trie.saved_steps
+
+    def _evaluate(self, input_dict: dict) -> list:
+        """Returns the values of each mapper, None for those with a result cache"""
+        processed = [
+            None if mapper.result_cache is not None else MISSING
+            for mapper in self.mappers
+        ]
+        if self.trie is not None and type(input_dict) is dict:
+            found = self.trie(input_dict)
+            for index in self.shared:
+                processed[index] = {}
+            for (index, k), node, start, end in self.plan:
+                if start is None:
+                    processed[index][k] = node(input_dict)
+                else:
+                    processed[index][k] = node.finish(found[start:end], input_dict)
+        for index, mapper in enumerate(self.mappers):
+            if processed[index] is MISSING:
+                processed[index] = mapper.evaluate(input_dict)
+        return processed
+
+    def _evaluate_many(self, input_dicts) -> list:
+        if self.has_lookups:
+            return _evaluate_batch(self._evaluate, input_dicts)
+        return [self._evaluate(input_dict) for input_dict in input_dicts]
+
+    def _outputs(self, input_dict: dict, processed: list, validate: bool) -> tuple:
+        return tuple(
+            (
+                mapper.apply(input_dict, validate)
+                if values is None
+                else construct_output(
+                    mapper.output_model, values, mapper._should_validate(validate)
+                )
+            )
+            for mapper, values in zip(self.mappers, processed)
+        )
+
+    def process(self, input_dict: dict) -> list:
+        """Returns the processed map of each mapper for the input dictionary"""
+        return [
+            mapper.evaluate(input_dict) if values is None else values
+            for mapper, values in zip(
+                self.mappers, self._evaluate_many([input_dict])[0]
+            )
+        ]
+
+    def apply(self, input_dict: dict, validate: bool = None) -> tuple:
+        """Maps a single input dictionary to one output model per mapper"""
+        processed = self._evaluate_many([input_dict])[0]
+        return self._outputs(input_dict, processed, validate)
+
+    def iter_mapped(self, input_dicts, validate: bool = None):
+        """Lazily maps an iterable of input dictionaries to tuples of output models
+
+        Maps with Lookups are evaluated Mapper.lookup_batch_size records at a time
+        """
+        if not self.has_lookups:
+            for input_dict in input_dicts:
+                yield self._outputs(input_dict, self._evaluate(input_dict), validate)
+            return
+        for chunk in iter_chunks(input_dicts, Mapper.lookup_batch_size):
+            for input_dict, processed in zip(chunk, self._evaluate_many(chunk)):
+                yield self._outputs(input_dict, processed, validate)
+
+    def map_many(self, input_dicts, validate: bool = None) -> list:
+        """Maps an iterable of input dictionaries to a list of output model tuples"""
+        return list(self.iter_mapped(input_dicts, validate))
+
+
+def key_getter(key):
+    """Returns a function reading key from an item
+
+    key is a dotted path, a tuple of paths for a composite key or a callable.
+    Other keys, like the index of a tuple item, are read with item[key].
+    A missing key raises KeyError
+    """
+    if callable(key):
+        return key
+    if isinstance(key, (tuple, list)):
+        getters = tuple(key_getter(k) for k in key)
+        return lambda item: tuple(get(item) for get in getters)
+    if not isinstance(key, str):
+        return operator.itemgetter(key)
+    keys = key.split(".")
+    if len(keys) == 1:
+        return operator.itemgetter(key)
+
+    def get(item):
+        # a key with dots in it is read as it is first
+        if key in item:
+            return item[key]
+        for k in keys:
+            item = item[k]
+        return item
+
+    return get
+
+
+class KeyedCollection:
+    """Dicts kept in insertion order and indexed by a key, for repeated upserts
+
+    Upserting an item with a key already in the collection replaces it in
+    place, so an item keeps its first position and its last value. The index
+    is kept between updates, so each upsert or delete is O(1)
+
+    Usage:
+        items = KeyedCollection("id", cart["line_items"])
+        items.upsert({"id": 3, "quantity": 2})
+        items.upsert_many(updated_items)
+        items.delete(4)
+        list(items)
+
+    key is a dotted path ("variant.id"), a tuple of paths for a composite
+    key (("product_id", "variant_id")) or a callable
+    """
+
+    def __init__(self, key, items=()):
+        self.key = key
+        self.key_of = key_getter(key)
+        self._items = {}
+        self.upsert_many(items)
+
+    def __repr__(self):
+        return f"KeyedCollection({self.key!r}, {len(self._items)} items)"
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __getitem__(self, key):
+        return self._items[key]
+
+    def get(self, key, default=None):
+        return self._items.get(key, default)
+
+    def keys(self):
+        return self._items.keys()
+
+    def upsert(self, item: dict):
+        """Adds item, or replaces the item with the same key in place"""
+        self._items[self.key_of(item)] = item
+
+    def upsert_many(self, items):
+        key_of = self.key_of
+        stored = self._items
+        for item in items:
+            stored[key_of(item)] = item
+
+    def delete(self, key):
+        """Removes the item with key, raises KeyError when there is none"""
+        del self._items[key]
+
+    def discard(self, key):
+        """Removes the item with key if there is one"""
+        self._items.pop(key, None)
+
+    def to_list(self) -> list:
+        return list(self._items.values())
 
 
 def update_nested_data(key: str, old_data: list, new_data: list) -> list:
     """Updates dict information nested inside a list if the key values match"""
-    lookup = {x[key]: x for x in old_data}
-    lookup.update({x[key]: x for x in new_data})
-    return list(lookup.values())
+    collection = KeyedCollection(key, old_data)
+    collection.upsert_many(new_data)
+    return collection.to_list()
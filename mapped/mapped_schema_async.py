@@ -0,0 +1,36 @@
+"""
+Awaiting the coroutine functions of the Mapped schema classes' maps
+
+Mapper.amap_many awaits the coroutines left in the evaluated maps here
+"""
+
+import asyncio
+import inspect
+
+# ReCharge Adapter Local Files
+from mapped_schema import collect_nested
+
+
+async def _limited(semaphore, awaitable):
+    if semaphore is None:
+        return await awaitable
+    async with semaphore:
+        return await awaitable
+
+
+async def await_values(processed: list, concurrency: int = None):
+    """Replaces the awaitables in the processed maps with their results
+
+    They are awaited concurrently, at most concurrency at a time
+    """
+    found = []
+    for values in processed:
+        collect_nested(values, found, inspect.isawaitable)
+    if not found:
+        return
+    semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+    results = await asyncio.gather(
+        *(_limited(semaphore, awaitable) for _, _, awaitable in found)
+    )
+    for (container, key, _), result in zip(found, results):
+        container[key] = result
@@ -0,0 +1,567 @@
+"""
+Benchmarks for the Mapped schema classes
+
+Run from this directory:
+    python mapped_schema_benchmark.py
+"""
+
+import json
+import os
+import time
+import timeit
+import tracemalloc
+from typing import List, Optional
+
+# Installed Packages
+from pydantic import BaseModel, create_model, validator
+
+# ReCharge Adapter Local Files
+from mapped_schema import (
+    DefaultBaseModel,
+    KeyedCollection,
+    Lookup,
+    MapDictToModel,
+    MapGroup,
+    Merge,
+    Sum,
+    construct_output,
+    generate_map,
+    update_nested_data,
+)
+from mapped_schema_external import update_nested_data_external
+
+with open(os.path.join(os.path.dirname(__file__), "..", "test.json")) as f:
+    checkout = json.load(f)["data"]
+
+
+def bench(label: str, func, number: int = 2000):
+    """Prints the best per call time of func in microseconds"""
+    per_call = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"{label:<45} {per_call * 1e6:10.2f} us")
+
+
+########## Line items map from line_items.py
+class LineItemsOutput(BaseModel):
+    physical_items: list
+
+
+class BCLineItems(MapDictToModel):
+    output_model = LineItemsOutput
+
+    map: dict = {
+        "physical_items": (
+            [
+                "line_items.physical_items",
+                "line_items.digital_items",
+                "line_items.gift_certificates",
+                "line_items.custom_items",
+            ],
+            [
+                {
+                    "productmy_collapsible_field_id": "product_id",
+                    "quantity": "quantity",
+                    "requires_shipping": "is_require_shipping",
+                    "taxable": "taxable",
+                    "variant_id": "variant_id",
+                    "price": "list_price",
+                    "discounts": (
+                        "discounts",
+                        [
+                            {
+                                "discounted_amount": "discounted_amount",
+                            }
+                        ],
+                    ),
+                }
+            ],
+        ),
+    }
+
+
+def bench_process_map():
+    mapper = BCLineItems(checkout)
+    compiled = mapper.compiled_map
+    generated, _ = generate_map(compiled)
+    assert mapper.process_map(mapper.map, checkout) == compiled(checkout)
+    assert generated(checkout) == compiled(checkout)
+
+    steps = BCLineItems.saved_path_steps()
+    print(f"BCLineItems map, per record ({steps} path steps hoisted)")
+    bench("process_map (interpreted)", lambda: mapper.process_map(mapper.map, checkout))
+    bench("compiled_map", lambda: compiled(checkout))
+    bench("generated source", lambda: generated(checkout))
+
+    # only physical items, without the optional keys the map asks for
+    sparse = {"line_items": {"physical_items": [{"product_id": 116, "quantity": 1}]}}
+    assert mapper.process_map(mapper.map, sparse) == compiled(sparse)
+    assert generated(sparse) == compiled(sparse)
+
+    print("BCLineItems map, sparse record")
+    bench("process_map (interpreted)", lambda: mapper.process_map(mapper.map, sparse))
+    bench("compiled_map", lambda: compiled(sparse))
+    bench("generated source", lambda: generated(sparse))
+
+
+########## Adapters run on the same checkout
+class TotalsOutput(BaseModel):
+    currency: str
+    base_amount: float
+    discount_amount: float
+    cart_amount: float
+    item_count: list
+
+
+class BCTotals(MapDictToModel):
+    output_model = TotalsOutput
+
+    map: dict = {
+        "currency": "currency.code",
+        "base_amount": "base_amount",
+        "discount_amount": "discount_amount",
+        "cart_amount": "cart_amount",
+        "item_count": (
+            ["line_items.physical_items", "line_items.digital_items"],
+            ["quantity"],
+        ),
+    }
+
+
+class CouponsOutput(BaseModel):
+    coupons: list
+
+
+class BCCoupons(MapDictToModel):
+    output_model = CouponsOutput
+
+    map: dict = {
+        "coupons": ("coupons", [{"code": "code", "amount": "discounted_amount"}]),
+    }
+
+
+def bench_map_group():
+    adapters = (BCLineItems, BCTotals, BCCoupons)
+    mappers = [adapter.as_mapper() for adapter in adapters]
+    group = MapGroup(*adapters)
+    assert group.apply(checkout) == tuple(m.apply(checkout) for m in mappers)
+
+    steps = group.saved_path_steps
+    print(f"{len(adapters)} adapters per checkout ({steps} path steps hoisted)")
+    bench("Mapper.apply for each adapter", lambda: [m.apply(checkout) for m in mappers])
+    bench("MapGroup.apply", lambda: group.apply(checkout))
+
+    # two adapters reading the same product catalog, the group loads both
+    # adapters' product ids with one loader call per batch
+    calls = []
+
+    def load_products(keys):
+        calls.append(keys)
+        time.sleep(0.005)  # a round trip to the catalog
+        return {key: {"id": key} for key in keys}
+
+    products = Lookup("product_id", load_products)
+
+    class BCProducts(MapDictToModel):
+        output_model = create_model("Products", products=(list, ...))
+        map = {"products": ("line_items.physical_items", [products])}
+
+    class BCPrices(MapDictToModel):
+        output_model = create_model("Prices", prices=(list, ...))
+        map = {
+            "prices": (
+                "line_items.physical_items",
+                [{"price": "list_price", "product": products}],
+            )
+        }
+
+    checkouts = [checkout] * 200
+    mappers = [BCProducts.as_mapper(), BCPrices.as_mapper()]
+    group = MapGroup(*mappers)
+    assert group.map_many(checkouts) == list(
+        zip(*(m.map_many(checkouts) for m in mappers))
+    )
+    calls.clear()
+    group.map_many(checkouts)
+    print(f"{len(checkouts)} checkouts, {len(calls)} loader call for both adapters")
+    bench(
+        "Mapper.map_many for each adapter",
+        lambda: [m.map_many(checkouts) for m in mappers],
+        number=20,
+    )
+    bench("MapGroup.map_many", lambda: group.map_many(checkouts), number=20)
+
+
+########## Columnar totals over many checkouts
+class LineItem(BaseModel):
+    quantity: Optional[int]
+    price: Optional[float]
+    discounts: Optional[list]
+
+
+class TypedLineItemsOutput(BaseModel):
+    physical_items: List[LineItem]
+
+
+class BCTypedLineItems(BCLineItems):
+    output_model = TypedLineItemsOutput
+
+
+def bench_columns():
+    checkouts = [checkout] * 200
+
+    def model_totals():
+        items = [
+            item
+            for mapped in BCTypedLineItems.map_many(checkouts)
+            for item in mapped.physical_items
+        ]
+        return sum(item.quantity for item in items), sum(i.price for i in items)
+
+    def column_totals():
+        columns = BCTypedLineItems.columns(checkouts, "physical_items")
+        return columns["quantity"].sum(), columns["price"].sum()
+
+    (quantity, price), (column_quantity, column_price) = model_totals(), column_totals()
+    assert quantity == column_quantity and round(price, 2) == round(column_price, 2)
+
+    print(f"quantity and price totals of {len(checkouts)} checkouts")
+    bench("map_many and sum the models", model_totals, number=20)
+    bench("columns and sum the arrays", column_totals, number=20)
+
+
+########## Summed discounts
+class DiscountsOutput(BaseModel):
+    summed_discounts: float
+
+
+class BCDiscounts(MapDictToModel):
+    output_model = DiscountsOutput
+
+    map: dict = {
+        "summed_discounts": Sum(
+            "line_items.physical_items", Sum("discounts", "discounted_amount")
+        ),
+    }
+
+
+def bench_aggregates():
+    def model_properties():
+        # like RechargeLineItems.summed_discounts over RCItems.summed_discounts
+        items = BCTypedLineItems.as_mapper().apply(checkout).physical_items
+        return sum(
+            sum(discount.get("discounted_amount", 0) for discount in item.discounts)
+            for item in items
+        )
+
+    def sum_spec():
+        return BCDiscounts.as_mapper().apply(checkout).summed_discounts
+
+    assert round(model_properties(), 2) == round(sum_spec(), 2)
+
+    print("summed discounts per checkout")
+    bench("mapped models and properties", model_properties)
+    bench("Sum spec in the map", sum_spec)
+
+
+########## Merged line item lists
+line_item_lists, (line_item_spec,) = BCLineItems.map["physical_items"]
+
+
+class MergedLineItems(BCLineItems):
+    map: dict = {"physical_items": Merge(line_item_lists, line_item_spec)}
+
+
+class DedupedLineItems(BCLineItems):
+    map: dict = {
+        "physical_items": Merge(line_item_lists * 2, line_item_spec, key="id"),
+    }
+
+
+def bench_merge():
+    tuple_map = BCLineItems(checkout).compiled_map
+    merge_map = MergedLineItems(checkout).compiled_map
+    deduped_map = DedupedLineItems(checkout).compiled_map
+    assert tuple_map(checkout) == merge_map(checkout) == deduped_map(checkout)
+
+    print("BCLineItems merge of the line item lists")
+    bench("(keys, search) tuple", lambda: tuple_map(checkout))
+    bench("Merge", lambda: merge_map(checkout))
+    bench("Merge of each list twice, keyed by id", lambda: deduped_map(checkout))
+
+
+########## Map keys the line item model drops
+def bench_pruned():
+    compiled = BCTypedLineItems(checkout).compiled_map
+    mapper = BCTypedLineItems.as_mapper()
+    model = TypedLineItemsOutput
+    assert mapper.apply(checkout) == construct_output(model, compiled(checkout))
+
+    print("BCLineItems map to typed line items")
+    bench("compiled_map and construct_output", lambda: model(**compiled(checkout)))
+    bench("Mapper.apply, dead keys pruned", lambda: mapper.apply(checkout))
+
+
+########## Cart updates
+class CartOutput(TotalsOutput):
+    physical_items: List[LineItem]
+
+
+class BCCart(MapDictToModel):
+    output_model = CartOutput
+
+    map: dict = {**BCTotals.map, **BCLineItems.map}
+
+
+def bench_remap():
+    mapper = BCCart.as_mapper()
+    previous = mapper.apply(checkout)
+    updated = dict(checkout, cart_amount=checkout["cart_amount"] + 1)
+    assert mapper.remap(previous, updated, checkout) == mapper.apply(updated)
+
+    print("cart_amount update of a mapped checkout")
+    bench("Mapper.apply", lambda: mapper.apply(updated))
+    bench(
+        "Mapper.remap, diffing the inputs",
+        lambda: mapper.remap(previous, updated, checkout),
+    )
+    bench(
+        "Mapper.remap, with changed_paths",
+        lambda: mapper.remap(previous, updated, changed_paths=["cart_amount"]),
+    )
+
+
+########## Reading a few fields
+class LazyBCCart(BCCart):
+    lazy = True
+
+
+def bench_lazy():
+    def read(mapped):
+        return mapped.currency, mapped.cart_amount
+
+    assert read(LazyBCCart(checkout).mapped) == read(BCCart(checkout).mapped)
+
+    print("currency and cart_amount of a mapped checkout")
+    bench("mapped", lambda: read(BCCart(checkout).mapped))
+    bench("lazy mapped", lambda: read(LazyBCCart(checkout).mapped))
+
+
+def bench_projection():
+    mapper = BCCart.as_mapper()
+    prices = {"physical_items": {"price"}}
+    assert mapper.project(checkout, prices)["physical_items"] == [
+        {"price": item.price} for item in mapper.apply(checkout).physical_items
+    ]
+
+    print("line item prices of a mapped checkout")
+    bench("Mapper.apply", lambda: mapper.apply(checkout))
+    bench("Mapper.compiled", lambda: mapper.compiled(checkout))
+    bench("Mapper.project", lambda: mapper.project(checkout, prices))
+
+
+########## Retried webhooks
+class CachedBCLineItems(BCLineItems):
+    result_cache_size = 1024
+
+
+def bench_result_cache():
+    raw = json.dumps(checkout).encode()
+    assert CachedBCLineItems.map_raw(raw) == BCLineItems.as_mapper().apply(checkout)
+    mapper, cached = BCLineItems.as_mapper(), CachedBCLineItems.as_mapper()
+
+    print("BCLineItems map, repeated checkout")
+    bench("Mapper.apply", lambda: mapper.apply(checkout))
+    bench("Mapper.apply, cached", lambda: cached.apply(checkout))
+    bench("json.loads and Mapper.apply", lambda: mapper.apply(json.loads(raw)))
+    bench("map_raw, cached", lambda: CachedBCLineItems.map_raw(raw))
+
+
+########## Process pool scaling
+def bench_parallel(records: int = 4000):
+    checkouts = [dict(checkout, id=str(i)) for i in range(records)]
+
+    def timed(label: str, func):
+        start = time.perf_counter()
+        func()
+        print(f"{label:<45} {(time.perf_counter() - start) * 1e3:10.2f} ms")
+
+    print(f"BCLineItems over {records} checkouts, including pool start up")
+    timed("map_many", lambda: BCLineItems.map_many(checkouts))
+    for workers in (1, 2, 4, 8):
+        timed(
+            f"map_parallel, {workers} workers",
+            lambda: list(BCLineItems.map_parallel(checkouts, workers, chunksize=250)),
+        )
+
+    def shared_totals(workers: int):
+        total = 0
+        columns = BCTypedLineItems.columns_parallel(
+            checkouts, "physical_items", workers, chunksize=250
+        )
+        for shared in columns:
+            with shared:
+                total += shared["price"].sum()
+        return total
+
+    for workers in (1, 2, 4, 8):
+        timed(f"columns_parallel, {workers} workers", lambda: shared_totals(workers))
+
+
+########## Line item updates applied to one cart
+def bench_keyed_updates(items: int = 200, updates: int = 1000):
+    cart = [{"id": i, "quantity": 1} for i in range(items)]
+    stream = [{"id": i % (items + 50), "quantity": i} for i in range(updates)]
+
+    def repeated_update_nested_data():
+        data = cart
+        for update in stream:
+            data = update_nested_data("id", data, [update])
+        return data
+
+    def keyed_collection():
+        collection = KeyedCollection("id", cart)
+        for update in stream:
+            collection.upsert(update)
+        return collection.to_list()
+
+    assert repeated_update_nested_data() == keyed_collection()
+
+    print(f"{updates} single item updates of a {items} item cart")
+    bench("update_nested_data per update", repeated_update_nested_data, number=5)
+    bench("KeyedCollection.upsert", keyed_collection, number=5)
+
+
+########## Nightly reconciliation
+def bench_external_merge(items: int = 100_000):
+    def old_items():
+        return ({"id": i, "quantity": 1, "title": f"item {i}"} for i in range(items))
+
+    def new_items():
+        # every third item updated
+        return ({"id": i, "quantity": 2} for i in range(0, items, 3))
+
+    def in_memory():
+        return sum(1 for _ in update_nested_data("id", old_items(), new_items()))
+
+    def external():
+        merged = update_nested_data_external(
+            "id", old_items(), new_items(), max_items=10_000
+        )
+        return sum(1 for _ in merged)
+
+    print(f"merging {items} line items, time and peak memory (traced)")
+    for label, merge in (("update_nested_data", in_memory), ("external", external)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        assert merge() == items
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{label:<30} {elapsed * 1e3:10.2f} ms {peak / 2**20:10.2f} MiB")
+
+
+########## 30 field model shaped like the checkouts line item in main.py
+line_item_fields = {
+    "prices": (Optional[str], "0.00"),
+    "addresses": (Optional[dict], None),
+    "test": (Optional[list], None),
+    "grams": (Optional[int], 0),
+    "line_price": (Optional[str], "0.00"),
+    "order_day_of_month": (Optional[bool], None),
+    "order_day_of_week": (Optional[bool], None),
+    "order_interval_frequency": (Optional[int], 30),
+    "order_interval_unit": (Optional[str], "day"),
+    "order_interval_unit_type": (Optional[str], "day"),
+    "original_price": (Optional[str], "0.00"),
+    "product_id": (Optional[int], None),
+    "product_type": (Optional[str], ""),
+    "properties": (Optional[bool], None),
+    "quantity": (Optional[int], 1),
+    "recurring_price": (Optional[str], "0.00"),
+    "requires_shipping": (Optional[bool], True),
+    "sku": (Optional[str], None),
+    "taxable": (Optional[bool], True),
+    "title": (Optional[str], None),
+    "variant_id": (Optional[int], None),
+    "variant_title": (Optional[str], None),
+    "vendor": (Optional[str], None),
+    "charge_interval_frequency": (Optional[int], 30),
+    "expire_after_specific_number_of_charges": (Optional[int], None),
+    "is_prepaid": (Optional[bool], False),
+    "discounted_amount": (Optional[float], 0.0),
+    "image_url": (Optional[str], None),
+    "currency": (Optional[str], "USD"),
+    "locale": (Optional[str], "en"),
+}
+
+line_item = {
+    "prices": "1.00",
+    "addresses": {"city": "Grenaccres", "state": "Ohie "},
+    "test": [{"cities": "Boca", "states": "FLORIDA "}],
+    "grams": 4536,
+    "line_price": "7.00",
+    "order_day_of_month": False,
+    "order_day_of_week": False,
+    "order_interval_frequency": None,
+    "order_interval_unit": None,
+    "order_interval_unit_type": "day",
+    "original_price": "450.00",
+    "product_id": 4313321766958,
+    "product_type": "",
+    "properties": False,
+    "quantity": None,
+    "recurring_price": "1.00",
+    "requires_shipping": None,
+    "sku": "MILK-1",
+    "taxable": False,
+    "title": "Milk renamed",
+    "variant_id": 30995615318062,
+    "variant_title": "a / b",
+    "vendor": "nemanjateststore",
+}
+
+
+class WildcardDefaultBaseModel(BaseModel):
+    """DefaultBaseModel with the previous per field wildcard validator"""
+
+    class Config:
+        use_enum_values = True
+        validate_assignment = True
+        arbitrary_types_allowed = True
+        orm_mode = True
+        nones_to_default = True
+
+    @validator("*", pre=True, always=True)
+    def _convert_nones_to_default(cls, val, field):
+        nones_to_default = getattr(cls.Config, "nones_to_default", True)
+        if nones_to_default and field.default and val is None:
+            return field.default
+        return val
+
+
+def bench_nones_to_default():
+    wildcard = create_model(
+        "WildcardLineItem", __base__=WildcardDefaultBaseModel, **line_item_fields
+    )
+    table = create_model("LineItem", __base__=DefaultBaseModel, **line_item_fields)
+    assert wildcard(**line_item).dict() == table(**line_item).dict()
+
+    print("30 field line item construction")
+    bench("wildcard nones_to_default validator", lambda: wildcard(**line_item))
+    bench("nones_to_default table", lambda: table(**line_item))
+
+
+if __name__ == "__main__":
+    bench_process_map()
+    bench_map_group()
+    bench_columns()
+    bench_aggregates()
+    bench_merge()
+    bench_pruned()
+    bench_remap()
+    bench_lazy()
+    bench_projection()
+    bench_result_cache()
+    bench_keyed_updates()
+    bench_external_merge()
+    bench_parallel()
+    bench_nones_to_default()
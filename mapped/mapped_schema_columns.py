@@ -0,0 +1,94 @@
+"""
+Columnar output of the Mapped schema classes
+
+Maps the list items of a ("path", [{...}]) map value into numpy columns,
+numpy is optional and only needed here
+"""
+
+# Installed Packages
+from glom import SKIP
+from pydantic import BaseModel as BM
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# ReCharge Adapter Local Files
+from mapped_schema import MISSING, column_searches
+
+_NUMPY_DTYPES = {int: "int64", float: "float64", bool: "bool"}
+
+
+def column_dtypes(output_model, field: str) -> dict:
+    """Returns a numpy dtype for each field of the item model of a list field
+
+    Fields that aren't int, float or bool (or Optional ones) are object columns
+    """
+    model_field = getattr(output_model, "__fields__", {}).get(field)
+    item_model = getattr(model_field, "type_", None)
+    if not isinstance(item_model, type) or not issubclass(item_model, BM):
+        return {}
+    return {
+        name: _NUMPY_DTYPES.get(item_field.type_, object)
+        for name, item_field in item_model.__fields__.items()
+    }
+
+
+def map_columns(node, input_dicts, dtypes: dict = None) -> dict:
+    """Maps the list items found by a compiled (path(s), [{...}]) map value
+    into one numpy masked array per key of the dict spec
+
+    The items of every input dictionary are rows of the same columns, values
+    that are missing or None are masked, so column.sum() skips them.
+    dtypes maps column names to numpy dtypes, other columns hold objects
+    """
+    if numpy is None:
+        raise ImportError("columnar mapping needs numpy installed")
+    searches, spec = column_searches(node)
+    names = [key for key, _ in spec.items]
+    dtypes = dtypes or {}
+    values = [[] for _ in names]
+    masks = [[] for _ in names]
+    for input_dict in input_dicts:
+        for search in searches:
+            rows = search.path(input_dict)
+            if type(rows) is not list and type(rows) is not tuple:
+                continue
+            for row in rows:
+                for i, (_, child) in enumerate(spec.items):
+                    val = child(row)
+                    missing = val is None or val is MISSING or val is SKIP
+                    masks[i].append(missing)
+                    values[i].append(0 if missing else val)
+    columns = {}
+    for name, column, mask in zip(names, values, masks):
+        dtype = dtypes.get(name, object)
+        if dtype is object:
+            # fromiter keeps nested lists as objects instead of a 2d array
+            column = (None if masked else val for val, masked in zip(column, mask))
+            data = numpy.fromiter(column, dtype=object, count=len(mask))
+        else:
+            data = numpy.array(column, dtype=dtype)
+        columns[name] = numpy.ma.MaskedArray(data, mask=numpy.array(mask, dtype=bool))
+    return columns
+
+
+def map_instance_columns(cls, input_dicts, field: str, dtypes: dict = None) -> dict:
+    """map_columns for MapDictToModel classes whose map or output_model are
+    properties, each record is mapped by its own instance's map
+
+    The columns of every record are concatenated, so they hold the same rows
+    as map_columns would for a class level map
+    """
+    parts = []
+    for input_dict in input_dicts:
+        instance = cls(input_dict)
+        node = dict(instance.compiled_map.items)[field]
+        types = {**column_dtypes(instance.output_model, field), **(dtypes or {})}
+        parts.append(map_columns(node, [input_dict], types))
+    if not parts:
+        return {}
+    return {
+        name: numpy.ma.concatenate([part[name] for part in parts]) for name in parts[0]
+    }
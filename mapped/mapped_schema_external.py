@@ -0,0 +1,159 @@
+"""
+Keyed merges of the Mapped schema classes larger than memory
+
+ExternalKeyedMerge spills its items to a temporary SQLite file
+"""
+
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+
+# ReCharge Adapter Local Files
+from mapped_schema import key_getter
+
+
+def _spill_key(key):
+    """Returns key with numbers that are equal as dict keys made the same
+
+    json.dumps would write 1, 1.0 and True differently
+    """
+    kind = type(key)
+    if kind is str or key is None:
+        return key
+    if kind is int or kind is bool:
+        return int(key)
+    if kind is float:
+        return int(key) if key.is_integer() else key
+    if kind is tuple:
+        return [_spill_key(k) for k in key]
+    raise TypeError(
+        f"ExternalKeyedMerge keys must be str, numbers, None or tuples of them, "
+        f"not {kind.__name__}"
+    )
+
+
+class ExternalKeyedMerge:
+    """KeyedCollection that spills to a SQLite file past max_items items
+
+    For merges larger than memory, like reconciling millions of line items.
+    Items are kept in memory until max_items, then moved to a temporary
+    SQLite file, where later upserts are written max_items at a time. An
+    item keeps its first position and its last value, like
+    update_nested_data, and iterating streams the items back in that order
+
+    Usage:
+        with ExternalKeyedMerge("id", max_items=100_000) as merge:
+            merge.upsert_many(old_items)
+            merge.upsert_many(new_items)
+            for item in merge:
+                ...
+
+    Keys are compared like dict keys, so 1, 1.0 and True are the same key.
+    They must be str, int, float, bool or None, or tuples of them for
+    composite keys, other keys raise TypeError once the items are spilled.
+    Items are stored pickled
+    """
+
+    def __init__(self, key, max_items: int = 100_000, directory: str = None):
+        self.key = key
+        self.key_of = key_getter(key)
+        self.max_items = max_items
+        self.directory = directory
+        self.path = None
+        self._db = None
+        self._items = {}
+
+    def __repr__(self):
+        where = self.path or "memory"
+        return f"ExternalKeyedMerge({self.key!r}, {where})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        if self._db is None:
+            return len(self._items)
+        self._flush()
+        return self._db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def __iter__(self):
+        if self._db is None:
+            yield from list(self._items.values())
+            return
+        self._flush()
+        # a separate cursor, so upserts while iterating don't reset it
+        for (value,) in self._db.cursor().execute(
+            "SELECT value FROM items ORDER BY position"
+        ):
+            yield pickle.loads(value)
+
+    @property
+    def spilled(self) -> bool:
+        """True once the items were moved to the SQLite file"""
+        return self._db is not None
+
+    def upsert(self, item: dict):
+        self.upsert_many((item,))
+
+    def upsert_many(self, items):
+        key_of = self.key_of
+        stored = self._items
+        for item in items:
+            stored[key_of(item)] = item
+            if len(stored) >= self.max_items:
+                self._flush()
+
+    def _flush(self):
+        """Writes the items in memory to the SQLite file, creating it first"""
+        if self._db is None:
+            fd, self.path = tempfile.mkstemp(suffix=".sqlite", dir=self.directory)
+            os.close(fd)
+            self._db = sqlite3.connect(self.path)
+            self._db.execute("PRAGMA journal_mode = OFF")
+            self._db.execute("PRAGMA synchronous = OFF")
+            # rows are read back in rowid order, upserts keep the first rowid
+            self._db.execute(
+                "CREATE TABLE items "
+                "(position INTEGER PRIMARY KEY, key TEXT UNIQUE, value BLOB)"
+            )
+        if self._items:
+            self._db.executemany(
+                "INSERT INTO items (key, value) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (
+                    (
+                        json.dumps(_spill_key(key)),
+                        pickle.dumps(item, pickle.HIGHEST_PROTOCOL),
+                    )
+                    for key, item in self._items.items()
+                ),
+            )
+            self._db.commit()
+            self._items.clear()
+
+    def close(self):
+        """Removes the SQLite file, the items can't be read afterwards"""
+        self._items.clear()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            os.remove(self.path)
+
+
+def update_nested_data_external(
+    key, old_data, new_data, max_items: int = 100_000, directory: str = None
+):
+    """update_nested_data for data larger than memory, see ExternalKeyedMerge
+
+    old_data and new_data can be any iterables, like generators reading
+    files, and the merged items are yielded one at a time
+    """
+    with ExternalKeyedMerge(key, max_items, directory) as merge:
+        merge.upsert_many(old_data)
+        merge.upsert_many(new_data)
+        yield from merge
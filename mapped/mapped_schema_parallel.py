@@ -0,0 +1,97 @@
+"""
+Process pool mapping of the Mapped schema classes
+
+Mapper.map_parallel and Mapper.columns_parallel run here, columns mapped by
+the workers are sent back through shared memory
+"""
+
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# ReCharge Adapter Local Files
+from mapped_schema import iter_chunks
+from mapped_schema_columns import map_columns, map_instance_columns
+from mapped_schema_shared import share_columns
+
+########## process pool workers
+_WORKER_MAPPER = None
+
+
+def _init_worker(mapper):
+    """ProcessPoolExecutor initializer, keeps the mapper for the worker's tasks
+
+    mapper is the MapDictToModel class itself when its map or output_model
+    are properties, the *_instances tasks then build an instance per record
+    """
+    global _WORKER_MAPPER
+    _WORKER_MAPPER = mapper
+
+
+def map_chunk(chunk: list, validate: bool = None) -> list:
+    return _WORKER_MAPPER.map_many(chunk, validate)
+
+
+def columns_chunk(chunk: list, field: str, dtypes: dict) -> tuple:
+    node = dict(_WORKER_MAPPER.compiled.items)[field]
+    return share_columns(map_columns(node, chunk, dtypes))
+
+
+def map_instances_chunk(chunk: list, validate: bool = None) -> list:
+    return [
+        _WORKER_MAPPER(input_dict)._instance_mapper().apply(input_dict, validate)
+        for input_dict in chunk
+    ]
+
+
+def instance_columns_chunk(chunk: list, field: str, dtypes: dict) -> tuple:
+    return share_columns(map_instance_columns(_WORKER_MAPPER, chunk, field, dtypes))
+
+
+def _finished(pending, ordered: bool):
+    """Removes the next finished chunks from pending and yields their results
+
+    Ordered pending chunks are a deque waited on in order, unordered ones a
+    set waited on until any of them is done. Each chunk stays in pending
+    until its result is taken, so closing the iterator partway through the
+    done chunks leaves the others to the caller's discard
+    """
+    if ordered:
+        yield pending.popleft().result()
+        return
+    for future in wait(pending, return_when=FIRST_COMPLETED).done:
+        pending.discard(future)
+        yield future.result()
+
+
+def parallel(
+    mapper, task, args, input_dicts, workers, chunksize, ordered, discard=None
+):
+    """Yields task(chunk, *args) for each chunk, run in worker processes
+
+    Each worker receives mapper once when it starts. discard is called with
+    the results the caller didn't take when the iterator is closed early
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(mapper,)
+    ) as executor:
+        # a few chunks per worker are queued, the input is read lazily
+        window = workers * 2
+        pending = deque() if ordered else set()
+        try:
+            for chunk in iter_chunks(input_dicts, chunksize):
+                future = executor.submit(task, chunk, *args)
+                if ordered:
+                    pending.append(future)
+                else:
+                    pending.add(future)
+                if len(pending) >= window:
+                    yield from _finished(pending, ordered)
+            while pending:
+                yield from _finished(pending, ordered)
+        finally:
+            if discard is not None:
+                for future in pending:
+                    if not future.cancel() and future.exception() is None:
+                        discard(future.result())
@@ -0,0 +1,140 @@
+"""
+Shared memory columns of the Mapped schema classes
+
+Worker processes copy their columns into one shared memory block per chunk
+and only send back its name and layout, the parent maps numpy arrays onto
+the block instead of unpickling the values
+"""
+
+from multiprocessing import resource_tracker, shared_memory
+
+# Installed Packages
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def share_columns(columns: dict) -> tuple:
+    """Copies map_columns() results into a new shared memory block
+
+    Returns (block name, layout). Numeric columns are stored as data and mask
+    arrays, string columns as utf-8 bytes with an offsets table and a mask.
+    Other object columns can't be shared and are sent in the layout
+    """
+    layout = []
+    arrays = []
+    for name, column in columns.items():
+        mask = numpy.ma.getmaskarray(column)
+        data = column.data
+        if data.dtype != object:
+            layout.append((name, "array", len(arrays)))
+            arrays += [data, mask]
+        elif all(type(val) is str for val in data[~mask]):
+            encoded = [b"" if val is None else val.encode() for val in data]
+            offsets = numpy.zeros(len(encoded) + 1, dtype="int64")
+            numpy.cumsum([len(val) for val in encoded], out=offsets[1:])
+            layout.append((name, "strings", len(arrays)))
+            arrays += [offsets, numpy.frombuffer(b"".join(encoded), "uint8"), mask]
+        else:
+            layout.append((name, "objects", (data.tolist(), mask.tolist())))
+    # 8 byte aligned offsets, so every array can be viewed in place
+    offsets, size = [], 0
+    for array in arrays:
+        offsets.append(size)
+        size += -(-array.nbytes // 8) * 8
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    # the parent unlinks the block, the worker's tracker must not
+    resource_tracker.unregister(shm._name, "shared_memory")
+    specs = []
+    for array, offset in zip(arrays, offsets):
+        view = numpy.ndarray(array.shape, array.dtype, buffer=shm.buf, offset=offset)
+        view[...] = array
+        specs.append((array.dtype.str, array.shape, offset))
+        del view
+    shm.close()
+    return shm.name, layout, specs
+
+
+def unlink_shared(shared: tuple):
+    """Frees a block from share_columns that won't be read"""
+    shm = shared_memory.SharedMemory(name=shared[0])
+    shm.close()
+    shm.unlink()
+
+
+class SharedStrings:
+    """String column read in place from a shared memory block
+
+    Strings are decoded when they are read, masked ones are None
+    """
+
+    def __init__(self, offsets, data, mask):
+        self.offsets = offsets
+        self.data = data
+        self.mask = mask
+
+    def __len__(self):
+        return len(self.mask)
+
+    def __getitem__(self, index: int):
+        if self.mask[index]:
+            return None
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return bytes(self.data[start:end]).decode()
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+    def tolist(self) -> list:
+        return list(self)
+
+
+class SharedColumns:
+    """Columns of a chunk written to shared memory by a worker process
+
+    columns holds numpy masked arrays and SharedStrings that are views into
+    the block, nothing is copied. Copy what you keep before close(), which
+    frees the block
+
+    Usage:
+        for shared in mapper.columns_parallel(input_dicts, "physical_items"):
+            with shared:
+                total += shared.columns["price"].sum()
+    """
+
+    def __init__(self, name: str, layout: list, specs: list):
+        self._shm = shared_memory.SharedMemory(name=name)
+        views = [
+            numpy.ndarray(shape, dtype, buffer=self._shm.buf, offset=offset)
+            for dtype, shape, offset in specs
+        ]
+        self.columns = {}
+        for column, kind, value in layout:
+            if kind == "array":
+                data, mask = views[value : value + 2]
+                self.columns[column] = numpy.ma.MaskedArray(data, mask=mask)
+            elif kind == "strings":
+                self.columns[column] = SharedStrings(*views[value : value + 3])
+            else:
+                values, mask = value
+                data = numpy.fromiter(values, dtype=object, count=len(values))
+                self.columns[column] = numpy.ma.MaskedArray(data, mask=mask)
+
+    def __getitem__(self, column: str):
+        return self.columns[column]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Drops the column views and frees the shared memory block"""
+        if self._shm is None:
+            return
+        self.columns = {}
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
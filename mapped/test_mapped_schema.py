@@ -0,0 +1,718 @@
+"""
+Tests for the Mapped schema classes
+
+Run from the repository root:
+    python -m pytest mapped
+"""
+
+import asyncio
+import copy
+import json
+import os
+from collections import OrderedDict
+from typing import Any, List
+
+# Installed Packages
+import pytest
+from glom import SKIP, STOP, Coalesce, Flatten, T
+from pydantic import BaseModel, create_model, root_validator
+
+# ReCharge Adapter Local Files
+from mapped_schema import (
+    DefaultBaseModel,
+    IgnoreGlom,
+    Lookup,
+    MapGroup,
+    MapDictToModel,
+    Mapper,
+    TTLCache,
+    _content_key,
+    _MappingMixinBase,
+    compile_map,
+    generate_map,
+    update_nested_data,
+)
+from mapped_schema_external import ExternalKeyedMerge
+from mapped_schema_shared import SharedColumns, share_columns
+
+with open(os.path.join(os.path.dirname(__file__), "..", "test.json")) as f:
+    checkout = json.load(f)["data"]
+
+
+class Interpreter(_MappingMixinBase):
+    """Runs maps with process_map, the interpreter compiled maps replace"""
+
+    output_model = None
+    map = None
+
+
+def interpret(map_dict: dict, input_dict):
+    return Interpreter().process_map(map_dict, input_dict)
+
+
+########## maps of the example scripts, which can't be imported
+
+# BCLineItems from example_merge.py and line_items.py
+line_items_map = {
+    "physical_items": (
+        [
+            "line_items.physical_items",
+            "line_items.digital_items",
+            "line_items.gift_certificates",
+            "line_items.custom_items",
+        ],
+        [
+            {
+                "productmy_collapsible_field_id": "product_id",
+                "quantity": "quantity",
+                "requires_shipping": "is_require_shipping",
+                "taxable": "taxable",
+                "variant_id": "variant_id",
+                "price": "list_price",
+                "discounts": (
+                    "discounts",
+                    [{"discounted_amount": "discounted_amount"}],
+                ),
+            }
+        ],
+    ),
+}
+
+# LineItems from example_merge.py
+example_merge_map = {
+    "price": "items.prices",
+    "address": (["items.addresses", "items.addresses2"], Flatten()),
+    "test": (
+        "items.test",
+        [{"city": Coalesce("city", default=""), "state": Coalesce("city", default="")}],
+    ),
+    "nested": (
+        "items.nested",
+        [
+            {
+                "test": (
+                    "ex.discounts",
+                    [
+                        {
+                            "city": Coalesce("id", default=""),
+                            "state": Coalesce("discounted_amount", default=""),
+                        }
+                    ],
+                )
+            }
+        ],
+    ),
+}
+
+# LineItems from nnnn.py
+nnnn_map = {
+    "price": "items.prices",
+    "address": "items.addresses",
+    "test": (
+        "items.test",
+        [{"city": Coalesce("city", default=""), "state": Coalesce("city", default="")}],
+    ),
+    "nested": (
+        "items.nested",
+        [{"test": ("ex.discounts", [{"city": Coalesce("id", default="")}])}],
+    ),
+}
+
+# MyClass from mapped_schema_example.py and the MapDictToModel docstring
+docstring_map = {
+    "my_pydantic_field": "items.price",
+    "my_nested_fields": (
+        "items.nested",
+        [{"my_list_val": "list_val", "my_amount": "amount"}],
+    ),
+    "my_collapsible_field": (["items", "items2"], "identical"),
+}
+
+# ExampleInputModel and ExampleIgnoreModel from mapped_schema_example.py
+example_input_map = {"store_id": None, "platform": 0.05, "store_hash": "11111"}
+example_ignore_map = {
+    "store_id": None,
+    "platform": 0.05,
+    "store_hash": IgnoreGlom("self.store.hash"),
+}
+
+# v2 from example_merge.py and nnnn.py
+example_merge_input = {
+    "items": {
+        "quantity": 7,
+        "prices": "1.00",
+        "addresses": ["asdf", "BOca Raon", "ff", "ff "],
+        "addresses2": ["ff", "BOca ff", "state", "FLORIDA "],
+        "test": [
+            {"city": "BOca Raon", "state": "FLORIDA "},
+            {"city": "Maimi", "state": "FLORIDA "},
+        ],
+        "nested": [
+            {"ex": {"discounts": [{"id": 3, "discount": 3.05}, {"id": 4}]}},
+            {"ex": {"discounts": [{"id": 3, "discounted_amount": 3.05}]}},
+        ],
+    },
+}
+
+# input_dict from mapped_schema_example.py
+docstring_input = {
+    "items": {
+        "price": 7,
+        "price2": 7,
+        "nested": [
+            {"list_val": 1, "amount": 3.05},
+            {"list_val": 2, "amount": 4},
+        ],
+        "identical": "value to be combined",
+    },
+    "items2": {"identical": "second value to be combined"},
+}
+
+########## edge cases of the compiled nodes
+
+edge_map = {
+    "ignored": IgnoreGlom("self.store.hash"),
+    "not_a_path": "not.a.path",
+    "none": None,
+    "number": 0.05,
+    "tuple": (3, 4),
+    "nested": {"a": "items.price", "b": ["items.price2", "x.y"], "c": {"d": "e.f"}},
+    "call": lambda input_dict: len(input_dict),
+    "star": "items.nested.*.amount",
+    "index": "items.nested.0.amount",
+    "negative_index": "items.nested.-1.amount",
+    "missing_index": "items.nested.9.amount",
+    "string_attribute": "items.identical.upper",
+    "missing_search": ("nope.x", [{"a": "b"}]),
+    "missing_item_key": ("items.nested", [{"a": "list_val", "b": "zzz"}]),
+    "item_index": ("items.tags", [("values", "0")]),
+    "chain": ("items", ("nested", ["amount"])),
+    "dict_search": ("items", {"p": "price", "q": "price2"}),
+    "coalesce": ("items", Coalesce("nope", "price")),
+    "coalesce_default": ("items", Coalesce("nope", "nope2", default="dflt")),
+    "coalesce_skip": ("items.nested", [Coalesce("list_val", skip=(1,), default=0)]),
+    "coalesce_factory": ("items.nested", [Coalesce("zzz", default_factory=list)]),
+    "skip_dict_value": (
+        "items.nested",
+        [{"v": "list_val", "a": Coalesce("missing", default=SKIP)}],
+    ),
+    "skip_items": ("items.nested", [lambda t: SKIP if t["list_val"] == 1 else t]),
+    "stop_items": ("items.nested", [lambda t: STOP if t["list_val"] == 2 else t]),
+    "skip_chain": ("items", lambda t: SKIP),
+    "stop_chain": ("items", lambda t: STOP),
+    "t_spec": ("items", T["price"]),
+    "merge_mixed": (["items.nested", "items.price", "items.identical", "zz"], T),
+    "merge_strings": (["items", "items2"], "identical"),
+    "merge_twice": (["items.nested", "items.nested"], [{"v": "list_val"}]),
+    "search_not_a_list": ("items.price", [{"a": "b"}]),
+    "none_in_path": "nothing.a",
+    "tuple_items": ("tuples", [{"i": "id"}]),
+    "ordered_dict": "ordered.a",
+}
+
+edge_input = copy.deepcopy(docstring_input)
+edge_input["nothing"] = None
+edge_input["items"]["tags"] = [{"values": ["a", "b"]}, {"values": ("c",)}]
+edge_input["tuples"] = ({"id": 9}, {"id": 10})
+edge_input["ordered"] = OrderedDict(a=1)
+
+CASES = [
+    ("line_items/test.json", line_items_map, checkout),
+    ("line_items/empty", line_items_map, {}),
+    (
+        "line_items/sparse",
+        line_items_map,
+        {"line_items": {"physical_items": [{"product_id": 1, "discounts": []}]}},
+    ),
+    ("example_merge", example_merge_map, example_merge_input),
+    ("example_merge/empty", example_merge_map, {"items": {}}),
+    ("nnnn", nnnn_map, example_merge_input),
+    ("docstring", docstring_map, docstring_input),
+    ("docstring/sparse", docstring_map, {"items": {"nested": [{"amount": 1}]}}),
+    ("example_input", example_input_map, {"store_hash": "11111"}),
+    ("example_ignore", example_ignore_map, {"store_hash": "22222"}),
+    ("edge", edge_map, edge_input),
+    ("edge/empty", edge_map, {}),
+    (
+        "test.json/root",
+        {
+            "id": "id",
+            "coupons": ("coupons", [{"code": "code", "amount": "discounted_amount"}]),
+            "currency": "currency.code",
+            "missing": "nope.deep",
+            "first_item": "line_items.physical_items.0.name",
+        },
+        checkout,
+    ),
+]
+
+
+def outcome(func, *args):
+    """Returns func's result, or the name of the exception it raised"""
+    try:
+        return func(*args)
+    except Exception as exc:
+        return ("raised", type(exc).__name__)
+
+
+@pytest.mark.parametrize(
+    "map_dict, input_dict", [case[1:] for case in CASES], ids=[c[0] for c in CASES]
+)
+def test_compiled_map_matches_process_map(map_dict, input_dict):
+    expected = outcome(interpret, map_dict, input_dict)
+    assert outcome(compile_map(map_dict), input_dict) == expected
+
+
+@pytest.mark.parametrize(
+    "map_dict, input_dict", [case[1:] for case in CASES], ids=[c[0] for c in CASES]
+)
+def test_generated_map_matches_process_map(map_dict, input_dict):
+    expected = outcome(interpret, map_dict, input_dict)
+    generated, source = generate_map(compile_map(map_dict))
+    assert outcome(generated, input_dict) == expected, source
+
+
+########## DefaultBaseModel nones_to_default
+
+
+class BlankToNone(DefaultBaseModel):
+    name: str = "dflt"
+
+    @root_validator(pre=True)
+    def _blank_to_none(cls, values):
+        if values.get("name") == "":
+            values = dict(values, name=None)
+        return values
+
+
+class BlankToNoneChild(BlankToNone):
+    other: str = "other"
+
+
+def test_nones_to_default_after_subclass_pre_root_validators():
+    assert BlankToNone(name="").name == "dflt"
+    assert BlankToNone(name=None).name == "dflt"
+    assert BlankToNoneChild(name="", other=None).dict() == {
+        "name": "dflt",
+        "other": "other",
+    }
+
+
+########## Mapper result cache
+
+
+class Cached(BaseModel):
+    items: list
+    key: Any = None
+
+
+def cached_mapper(**kwargs):
+    return Mapper(
+        {"items": "items", "key": "key"},
+        Cached,
+        result_cache=TTLCache(ttl=60),
+        **kwargs,
+    )
+
+
+def test_result_cache_hits_return_the_cached_model():
+    mapper = cached_mapper()
+    first = mapper.apply({"items": [{"a": 1}]})
+    assert mapper.apply({"items": [{"a": 1}]}) is first
+    assert mapper.cache_stats()["hits"] == 1
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        ({"items": [], "key": {1: "x"}}, {"items": [], "key": {"1": "x"}}),
+        ({"items": [], "key": (1, 2)}, {"items": [], "key": [1, 2]}),
+        ({"items": [], "key": 1}, {"items": [], "key": 1.0}),
+        ({"items": [], "key": 1}, {"items": [], "key": True}),
+    ],
+    ids=["int_key", "tuple", "float", "bool"],
+)
+def test_result_cache_keys_tell_types_apart(first, second):
+    assert _content_key(first) != _content_key(second)
+    mapper = cached_mapper()
+    assert type(mapper.apply(first).key) is type(first["key"])
+    assert type(mapper.apply(second).key) is type(second["key"])
+    assert mapper.cache_stats()["hits"] == 0
+
+
+def test_result_cache_skips_inputs_that_cant_be_pickled():
+    assert _content_key({"items": [], "key": lambda: None}) is None
+
+
+def test_result_cache_raw_payloads():
+    mapper = cached_mapper()
+    raw = json.dumps({"items": [1]})
+    assert mapper.apply_raw(raw).items == [1]
+    assert mapper.apply_raw(raw.encode()).items == [1]
+    assert mapper.cache_stats()["hits"] == 1
+
+
+def test_result_cache_counts_validate_every_once():
+    mapper = cached_mapper(validate=False, validate_every=2)
+    start = next(mapper._records)
+    mapper.apply({"items": []})
+    mapper.apply({"items": []})
+    assert next(mapper._records) == start + 3
+
+
+########## keyed updates
+
+
+def test_update_nested_data_non_str_keys():
+    old = [(1, "a"), (2, "b")]
+    assert update_nested_data(0, old, [(2, "c"), (3, "d")]) == [
+        (1, "a"),
+        (2, "c"),
+        (3, "d"),
+    ]
+    assert update_nested_data(1, [{1: "x", "v": 1}], [{1: "x", "v": 2}]) == [
+        {1: "x", "v": 2}
+    ]
+
+
+def test_update_nested_data_dotted_keys():
+    old = [{"id": {"a": 1}, "v": 1}, {"id.a": 2, "v": 1}]
+    new = [{"id": {"a": 1}, "v": 2}, {"id.a": 2, "v": 2}]
+    assert update_nested_data("id.a", old, new) == new
+
+
+def test_external_merge_compares_keys_like_dicts(tmp_path):
+    with ExternalKeyedMerge("id", max_items=1, directory=tmp_path) as merge:
+        merge.upsert_many([{"id": 1, "v": 1}, {"id": "1", "v": 1}])
+        merge.upsert_many([{"id": 1.0, "v": 2}, {"id": True, "v": 3}])
+        merge.upsert_many([{"id": (1, "a"), "v": 1}, {"id": (1.0, "a"), "v": 2}])
+        assert merge.spilled
+        assert list(merge) == [
+            {"id": True, "v": 3},
+            {"id": "1", "v": 1},
+            {"id": (1.0, "a"), "v": 2},
+        ]
+        with pytest.raises(TypeError):
+            merge.upsert({"id": object()})
+
+
+########## dead map keys
+
+
+def test_dead_keys_warning_points_at_the_caller():
+    class Output(BaseModel):
+        a: int = 0
+
+    class Mapping(MapDictToModel):
+        output_model = Output
+        map = {"a": "a", "dead": "b"}
+
+    with pytest.warns(UserWarning, match="skips map keys .*: dead") as record:
+        Mapping.map_many([{"a": 1}])
+    assert record[0].filename == __file__
+
+
+########## projections
+
+
+class PerInstance(MapDictToModel):
+    @property
+    def output_model(self):
+        return create_model("PerInstanceOutput", a=(Any, None), b=(Any, None))
+
+    @property
+    def map(self):
+        return {"a": "x", "b": ("y", len)}
+
+
+def test_project_many_with_map_properties():
+    inputs = [{"x": 1, "y": [1, 2]}, {"x": 2, "y": []}]
+    assert PerInstance.project_many(inputs, ["b"]) == [{"b": 2}, {"b": 0}]
+    assert PerInstance(inputs[0]).project(["a"]) == {"a": 1}
+
+
+########## pre root validators reading keys without a field
+
+
+class FullName(BaseModel):
+    full_name: str = None
+
+    @root_validator(pre=True)
+    def _full_name(cls, values):
+        if "first" in values:
+            values = dict(values, full_name=f"{values['first']} {values['last']}")
+        return values
+
+
+class Customer(BaseModel):
+    customer: FullName = None
+    customers: List[FullName] = []
+
+
+class FullNameMapping(MapDictToModel):
+    output_model = FullName
+    map = {"first": "a", "last": "b"}
+
+
+def test_pruning_keeps_keys_pre_root_validators_read():
+    assert FullName(first="x", last="y").full_name == "x y"
+    assert FullNameMapping({"a": "x", "b": "y"}).mapped.full_name == "x y"
+
+
+def test_pruning_keeps_nested_keys_pre_root_validators_read():
+    mapper = Mapper(
+        {
+            "customer": {"first": "a", "last": "b"},
+            "customers": ("people", [{"first": "a", "last": "b"}]),
+        },
+        Customer,
+    )
+    mapped = mapper.apply({"a": "x", "b": "y", "people": [{"a": "p", "b": "q"}]})
+    assert mapped.customer.full_name == "x y"
+    assert [c.full_name for c in mapped.customers] == ["p q"]
+
+
+########## incremental remapping
+
+
+class Order(DefaultBaseModel):
+    name: str = "guest"
+    price: float = None
+    qty: int = None
+    calls: int = None
+
+
+class PricedOrder(Order):
+    total: float = 0
+
+    @root_validator(pre=True)
+    def _total(cls, values):
+        if values.get("price") is not None and values.get("qty") is not None:
+            values = dict(values, total=values["price"] * values["qty"])
+        return values
+
+
+def order_mapper(output_model=Order):
+    calls = []
+    order_map = {
+        "name": "customer.name",
+        "price": "item.price",
+        "qty": "item.qty",
+        "calls": ("customer", lambda customer: calls.append(customer) or len(calls)),
+    }
+    return Mapper(order_map, output_model), calls
+
+
+old_order = {"customer": {"name": "ann"}, "item": {"price": 2.5, "qty": 3}}
+new_order = {"customer": {"name": "ann"}, "item": {"price": 5.0, "qty": 3}}
+
+
+def test_remap_recomputes_the_changed_paths_only():
+    mapper, calls = order_mapper()
+    old = mapper.apply(old_order)
+    remapped = mapper.remap(old, new_order, old_order)
+    assert remapped == old.copy(update={"price": 5.0})
+    assert len(calls) == 1
+    renamed = copy.deepcopy(new_order)
+    renamed["customer"]["name"] = None
+    remapped = mapper.remap(old, renamed, old_order)
+    assert remapped.name == "guest" and remapped.calls == 2
+
+
+def test_remap_changed_paths():
+    mapper, calls = order_mapper()
+    old = mapper.apply(old_order)
+    assert mapper.remap(old, new_order, changed_paths=["item.price"]).price == 5.0
+    assert mapper.remap(old, new_order, changed_paths=["nope"]) == old
+    assert len(calls) == 1
+
+
+def test_remap_with_pre_root_validators_maps_in_full():
+    mapper, calls = order_mapper(PricedOrder)
+    old = mapper.apply(old_order)
+    assert old.total == 7.5
+    remapped = mapper.remap(old, new_order, old_order)
+    assert remapped.total == 15.0
+    assert len(calls) == 2
+
+
+########## lazy output
+
+
+def test_lazy_maps_the_fields_read():
+    mapper, calls = order_mapper()
+    lazy = mapper.lazy(new_order)
+    assert lazy.price == 5.0 and lazy.name == "ann"
+    assert calls == []
+    assert repr(lazy) == "LazyMapped(Order, [price, name])"
+    assert lazy.calls == 1
+    assert lazy == mapper.apply(new_order).copy(update={"calls": 1})
+
+
+def test_lazy_replaces_nones_with_defaults():
+    mapper, _ = order_mapper()
+    no_name = {"customer": {"name": None}}
+    assert mapper.lazy(no_name).name == "guest"
+    assert mapper.lazy(no_name, validate=False).name == "guest"
+
+
+def test_lazy_with_pre_root_validators_maps_in_full():
+    mapper, _ = order_mapper(PricedOrder)
+    lazy = mapper.lazy(new_order)
+    assert lazy.total == 15.0
+    assert lazy.dict()["total"] == 15.0
+
+
+########## batched lookups
+
+
+def load_batch_sizes(keys):
+    """Loader whose values are the number of keys of the call that loaded them"""
+    return {key: len(keys) for key in keys}
+
+
+class Looked(BaseModel):
+    items: list
+
+
+def lookup_mapper(key_path="id"):
+    lookup = Lookup(key_path, load_batch_sizes)
+    return Mapper({"items": ("items", [lookup])}, Looked)
+
+
+lookup_inputs = [{"items": [{"id": i, "other": -i - 1}]} for i in range(5)]
+
+
+def test_lookups_are_loaded_once_per_batch():
+    mapper = lookup_mapper()
+    assert [m.items for m in mapper.map_many(lookup_inputs)] == [[5]] * 5
+    assert mapper.apply(lookup_inputs[0]).items == [1]
+
+
+def test_map_group_loads_the_lookups_of_every_map_together():
+    calls = []
+    lookup = Lookup("id", lambda keys: calls.append(keys) or load_batch_sizes(keys))
+    group = MapGroup(
+        Mapper({"items": ("items", [lookup])}, Looked),
+        Mapper({"items": ("items", [{"id": lookup}])}, Looked),
+    )
+    mapped = group.map_many(lookup_inputs)
+    assert [(a.items, b.items) for a, b in mapped] == [([5], [{"id": 5}])] * 5
+    assert len(calls) == 1
+
+
+def test_map_parallel_loads_lookups_once_per_chunk():
+    mapped = lookup_mapper().map_parallel(lookup_inputs, workers=1, chunksize=5)
+    assert [m.items for m in mapped] == [[5]] * 5
+
+
+########## maps with coroutine functions and per instance maps
+
+
+class Item(BaseModel):
+    quantity: int = None
+    title: str = None
+
+
+class Items(BaseModel):
+    items: List[Item] = []
+
+
+class PerInstanceItems(MapDictToModel):
+    output_model = property(lambda self: Items)
+
+    @property
+    def map(self):
+        return {"items": ("lines", [{"quantity": "qty", "title": "name"}])}
+
+
+async def shout(input_dict):
+    return input_dict["name"].upper()
+
+
+class Shout(BaseModel):
+    name: str = None
+
+
+class AsyncPerInstance(MapDictToModel):
+    output_model = Shout
+    map = property(lambda self: {"name": shout})
+
+
+items_inputs = [
+    {"lines": [{"qty": 1, "name": "a"}, {"qty": None, "name": "b"}]},
+    {"lines": [{"qty": 3, "name": "c"}]},
+]
+
+
+def test_amap_many_with_map_properties():
+    mapped = asyncio.run(AsyncPerInstance.amap_many([{"name": "a"}, {"name": "b"}]))
+    assert [m.name for m in mapped] == ["A", "B"]
+    assert asyncio.run(AsyncPerInstance({"name": "c"}).amapped()).name == "C"
+
+
+def test_map_parallel_with_map_properties():
+    mapped = PerInstanceItems.map_parallel(items_inputs, workers=1, chunksize=1)
+    assert [[i.quantity for i in m.items] for m in mapped] == [[1, None], [3]]
+
+
+def test_columns_with_map_properties():
+    pytest.importorskip("numpy")
+    columns = PerInstanceItems.columns(items_inputs, "items")
+    assert columns["quantity"].sum() == 4
+    assert columns["quantity"].dtype == "int64"
+    assert columns["title"].tolist() == ["a", "b", "c"]
+    assert PerInstanceItems.columns([], "items") == {}
+
+
+def test_sync_mapping_of_async_maps_raises():
+    mapper = Mapper({"name": shout}, Shout)
+    with pytest.raises(TypeError, match="aapply"):
+        mapper.apply({"name": "a"})
+    with pytest.raises(TypeError, match="aapply"):
+        mapper.map_many([{"name": "a"}])
+    with pytest.raises(TypeError, match="aapply"):
+        MapGroup(mapper)
+    with pytest.raises(TypeError, match="aapply"):
+        AsyncPerInstance({"name": "a"}).mapped
+    assert asyncio.run(mapper.aapply({"name": "a"})).name == "A"
+
+
+########## shared memory columns
+
+
+def test_shared_columns_round_trip():
+    numpy = pytest.importorskip("numpy")
+    masked = numpy.ma.MaskedArray
+    columns = {
+        "quantity": masked([1, 0, 3], mask=[False, True, False]),
+        "price": masked([1.5, 2.5, 0.0], mask=[False, False, True]),
+        "title": masked(
+            numpy.array(["a", "ü", None], dtype=object), mask=[False, False, True]
+        ),
+        "tags": masked(
+            numpy.array([["x"], None, 2], dtype=object), mask=[False, True, False]
+        ),
+    }
+    with SharedColumns(*share_columns(columns)) as shared:
+        assert shared["quantity"].tolist() == [1, None, 3]
+        assert shared["quantity"].dtype == "int64"
+        assert shared["price"].tolist() == [1.5, 2.5, None]
+        assert shared["title"].tolist() == ["a", "ü", None]
+        assert shared["tags"].tolist() == [["x"], None, 2]
+    assert shared.columns == {}
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="needs /dev/shm")
+@pytest.mark.parametrize("ordered", [True, False])
+def test_columns_parallel_frees_blocks_when_closed_early(ordered):
+    pytest.importorskip("numpy")
+    mapper = Mapper({"items": ("lines", [{"quantity": "qty", "title": "name"}])}, Items)
+    before = set(os.listdir("/dev/shm"))
+    chunks = mapper.columns_parallel(
+        items_inputs * 10, "items", workers=2, chunksize=1, ordered=ordered
+    )
+    with next(chunks) as shared:
+        assert len(shared["quantity"]) in (1, 2)
+    chunks.close()
+    assert set(os.listdir("/dev/shm")) - before == set()